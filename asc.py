@@ -0,0 +1,285 @@
+"""
+This file contains the functions necessary for
+cutting the gaze data in the eyetracker's .asc files (converted from .edf with
+edf2asc) into epochs around the triggers, without loading whole files into memory.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+To epoch all .asc files of a session, run:
+
+   python asc.py <directory> <session> <participant>
+
+made by Anna van Harmelen, 2025
+"""
+
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import re
+import numpy as np
+from triggers import TriggerCodec
+
+# Windows around the triggers to cut epochs for, in ms relative to the trigger.
+# Epochs have one row per ms, as the tracker samples at 1000 Hz.
+EPOCH_WINDOWS = {
+    "stimuli_onset": (-250, 1000),
+    "capture_cue_onset": (-250, 1500),
+}
+CHANNELS = ["x", "y", "pupil"]
+
+# Longest time a trigger can be written after its flip, in ms (the message
+# offset), so the samples before the flip are still in memory
+MAX_MESSAGE_OFFSET = 1000
+
+# Columns of the recorded eye in a sample line, after the time
+EYE_COLUMNS = {
+    ("right", False): slice(1, 4),
+    ("left", False): slice(1, 4),
+    ("left", True): slice(1, 4),
+    ("right", True): slice(4, 7),
+}
+
+# e.g. 'MSG\t1234567 12 trig112', the offset is optional
+TRIGGER_MESSAGE = re.compile(r"MSG\s+(\d+)\s+(?:(-?\d+)\s+)?trig(\d+)")
+
+# e.g. 'MSG\t1234560 0 TRIALID 12', sent at the start of every trial
+TRIAL_ID_MESSAGE = re.compile(r"MSG\s+\d+\s+(?:-?\d+\s+)?TRIALID\s+(\d+)")
+
+
+def parse_value(value):
+    # Missing data is written as '.'
+    return float(value) if value != "." else np.nan
+
+
+class EpochFile:
+    """
+    Appends epochs of one trigger to a binary file, one row of
+    (window length x channels) float32 values per trial.
+
+    usage:
+
+       epochs = EpochFile(path, window)
+       epochs.append(trial_number, factors, epoch)
+       epochs.close()
+    """
+
+    def __init__(self, path, window) -> None:
+        self.path = path
+        self.window = window
+        self.file = open(path, "wb")
+        self.trials = []
+
+    def append(self, trial_number, factors, epoch):
+        self.file.write(epoch.astype(np.float32).tobytes())
+        self.trials.append({"trial_number": trial_number, **factors})
+
+    def close(self):
+        self.file.close()
+
+        return {
+            "path": os.path.basename(self.path),
+            "window": list(self.window),
+            "channels": CHANNELS,
+            "trials": self.trials,
+        }
+
+
+def parse_asc(path, output_prefix, windows=EPOCH_WINDOWS, eye="right"):
+    """
+    Stream through one .asc file and write an epoch for every trigger in `windows`.
+    Trials are numbered by their TRIALID message, like `trial_number` in
+    data_session_N.csv. Files without them (recorded before TRIALID was sent)
+    are numbered from 1 in this file, at every stimuli onset.
+    Only the last samples that could still be part of an epoch are kept in memory.
+    Returns the index of all epochs, which is also saved as `output_prefix`.json.
+    """
+    codec = TriggerCodec()
+    longest_before = max(-start for start, _ in windows.values())
+    history = deque(maxlen=max(1, longest_before) + MAX_MESSAGE_OFFSET)
+
+    epoch_files = {
+        frame: EpochFile(f"{output_prefix}_{frame}.epochs", window)
+        for frame, window in windows.items()
+    }
+    pending = []  # epochs that are still being filled
+    columns = EYE_COLUMNS[(eye, False)]
+    trial_number = 0
+    trial_ids = False
+
+    def finish(epoch):
+        frame, number, factors, _, _, values = epoch
+        epoch_files[frame].append(number, factors, values)
+
+    def fill(epoch, time, values):
+        _, _, _, start, end, epoch_values = epoch
+        if start <= time < end:
+            epoch_values[int(time - start)] = values
+
+    with open(path) as file:
+        for line in file:
+            # Samples start with their time, everything else with a word
+            if line[0].isdigit():
+                fields = line.split()
+                time = float(fields[0])
+                values = [parse_value(value) for value in fields[columns]]
+                history.append((time, values))
+
+                for epoch in pending:
+                    fill(epoch, time, values)
+
+                while pending and time >= pending[0][4] - 1:
+                    finish(pending.pop(0))
+
+            # e.g. 'SAMPLES\tGAZE\tLEFT\tRIGHT\tRATE\t1000.00...' at every recording start
+            elif line.startswith("SAMPLES"):
+                binocular = "LEFT" in line.split() and "RIGHT" in line.split()
+                columns = EYE_COLUMNS[(eye, binocular)]
+
+            elif line.startswith("MSG") and (match := TRIAL_ID_MESSAGE.match(line)):
+                trial_number = int(match.group(1))
+                trial_ids = True
+
+            elif line.startswith("MSG") and (match := TRIGGER_MESSAGE.match(line)):
+                time, offset, code = match.groups()
+                time = int(time) - int(offset or 0)
+
+                if code not in codec.factors:
+                    continue
+
+                factors = codec.decode(code)
+                frame = factors.pop("frame")
+
+                if frame == "stimuli_onset" and not trial_ids:
+                    trial_number += 1
+
+                if frame not in windows:
+                    continue
+
+                start, end = time + windows[frame][0], time + windows[frame][1]
+                epoch = (
+                    frame,
+                    trial_number,
+                    factors,
+                    start,
+                    end,
+                    np.full((end - start, len(CHANNELS)), np.nan),
+                )
+                for sample_time, values in history:
+                    fill(epoch, sample_time, values)
+
+                pending.append(epoch)
+                pending.sort(key=lambda epoch: epoch[4])
+
+    # The recording stopped before these epochs ended
+    for epoch in pending:
+        finish(epoch)
+
+    index = {
+        "n_trials": trial_number,
+        "trial_ids": trial_ids,
+        "epochs": {frame: epochs.close() for frame, epochs in epoch_files.items()},
+    }
+    with open(f"{output_prefix}.json", "w") as file:
+        json.dump(index, file)
+
+    return index
+
+
+def find_asc_files(directory, session, participant):
+    """
+    The .asc files of a session, in the order they were recorded: either one file
+    for the whole session, or one per block (see eyetracker.Eyelinker).
+    """
+    pattern = re.compile(rf"{session}_{participant}(?:_(\d+))?\.asc$")
+    matches = [
+        (int(match.group(1) or 0), filename)
+        for filename in os.listdir(directory)
+        if (match := pattern.match(filename))
+    ]
+
+    return [os.path.join(directory, filename) for _, filename in sorted(matches)]
+
+
+def parse_session(paths, output_directory, windows=EPOCH_WINDOWS, processes=None):
+    """
+    Parse all .asc files of a session in parallel, and number their trials like
+    `trial_number` in data_session_N.csv. A trial that was interrupted and shown
+    again after --resume keeps the epochs of the file recorded last.
+    Returns the index of all epochs, which is also saved as epochs.json.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    prefixes = [
+        os.path.join(output_directory, os.path.splitext(os.path.basename(path))[0])
+        for path in paths
+    ]
+
+    with ProcessPoolExecutor(processes) as executor:
+        indices = list(executor.map(parse_asc, paths, prefixes, [windows] * len(paths)))
+
+    # Without TRIALID messages, trials continue numbering from one file to the next
+    session = {frame: [] for frame in windows}
+    first_trial = 0
+    for index in indices:
+        for frame, epochs in index["epochs"].items():
+            if not index["trial_ids"]:
+                for trial in epochs["trials"]:
+                    trial["trial_number"] += first_trial
+            session[frame].append(epochs)
+
+        if index["trial_ids"]:
+            first_trial = index["n_trials"]
+        else:
+            first_trial += index["n_trials"]
+
+    with open(os.path.join(output_directory, "epochs.json"), "w") as file:
+        json.dump(session, file)
+
+    return session
+
+
+def load_epochs(output_directory, frame):
+    """
+    Returns a dict of trial number to epoch (window length x channels), memory-mapped
+    from the files written by parse_session, so nothing is read until it's used.
+    """
+    with open(os.path.join(output_directory, "epochs.json")) as file:
+        session = json.load(file)
+
+    epochs = {}
+    for epoch_file in session[frame]:
+        start, end = epoch_file["window"]
+        shape = (len(epoch_file["trials"]), end - start, len(epoch_file["channels"]))
+        if not shape[0]:
+            continue
+
+        values = np.memmap(
+            os.path.join(output_directory, epoch_file["path"]),
+            dtype=np.float32,
+            mode="r",
+            shape=shape,
+        )
+        for trial, epoch in zip(epoch_file["trials"], values):
+            epochs[trial["trial_number"]] = epoch
+
+    return epochs
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Cut the .asc files of a session into epochs.")
+    parser.add_argument("directory")
+    parser.add_argument("session", type=int)
+    parser.add_argument("participant", type=int)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    paths = find_asc_files(args.directory, args.session, args.participant)
+    output = args.output or os.path.join(
+        args.directory, f"epochs_session_{args.session}_{args.participant}"
+    )
+
+    session = parse_session(paths, output, processes=args.processes)
+    for frame, epoch_files in session.items():
+        n_epochs = sum(len(epoch_file["trials"]) for epoch_file in epoch_files)
+        print(f"{frame}: {n_epochs} epochs from {len(paths)} files")
@@ -0,0 +1,223 @@
+"""
+This script measures how long it takes to build and draw every screen
+of the 'action coupled null-cue' experiment, relative to the frame budget.
+
+To store the results as a new baseline:
+
+   python benchmark.py --save
+
+To check for performance regressions against the stored baseline:
+
+   python benchmark.py --check
+
+made by Anna van Harmelen, 2025
+"""
+
+from argparse import ArgumentParser
+from time import perf_counter
+import json
+import os
+import sys
+import numpy as np
+from itertools import count
+from set_up import get_settings
+from stimuli import (
+    create_fixation_dot,
+    create_stimuli_frame,
+    create_capture_cue_frame,
+    create_probe_cue_frame,
+    show_text,
+)
+from response import make_dial, draw_dial_frame
+
+BASELINE_FILE = "benchmark_baseline.json"
+REFRESH_RATES = [60, 239]
+
+# A builder fails the check when its 99th percentile gets this much slower than the baseline
+TOLERANCE = 0.25
+MIN_REGRESSION_MS = 0.05  # to ignore noise in very fast builders
+
+# ... or when it takes up more than this part of a frame at the highest refresh rate
+MAX_BUDGET_FRACTION = 0.5
+NOT_IN_TRIALS = ["camera_image"]  # only shown while setting up the eyetracker
+
+monitor = {
+    "resolution": (1920, 1080),  # in pixels
+    "Hz": 239,  # screen refresh rate in Hz
+    "width": 53,  # in cm
+    "distance": 70,  # in cm
+}
+
+# Size of the eyetracker's camera image, in pixels
+CAMERA_IMAGE_SIZE = (192, 160)
+
+
+def get_camera_image(display):
+    """
+    Feeds a synthetic camera image to the display line by line, like the
+    eyetracker does during set-up. The last line also draws and flips it.
+    """
+    width, height = CAMERA_IMAGE_SIZE
+    random = np.random.default_rng(0)
+    display.set_image_palette(*random.integers(0, 256, (3, 256)))
+    lines = random.integers(0, 256, (height, width), dtype=np.uint8)
+
+    def draw_camera_image():
+        for line, buffer in enumerate(lines, start=1):
+            display.draw_image_line(width, line, height, buffer)
+
+    return draw_camera_image
+
+
+def get_builders(settings):
+    dial = make_dial(settings, settings["colours"][0])
+    turns = count()
+
+    builders = {
+        "create_fixation_dot": lambda: create_fixation_dot(settings, "respond 3"),
+        "create_stimuli_frame": lambda: create_stimuli_frame(
+            -45, 30, settings["colours"][0:2], "respond 3", settings
+        ),
+        "create_capture_cue_frame": lambda: create_capture_cue_frame(
+            settings["colours"][2], "respond 3", settings
+        ),
+        "create_probe_cue_frame": lambda: create_probe_cue_frame(
+            settings["colours"][0], "respond 3", settings
+        ),
+        "show_text": lambda: show_text(
+            "87", settings["window"], settings["geometry"].feedback_position
+        ),
+        "dial_frame": lambda: draw_dial_frame(
+            dial,
+            settings["dial_trajectory"][0][next(turns) % monitor["Hz"] + 1],
+            [],
+            "respond 3",
+            settings,
+        ),
+    }
+
+    # The camera image display needs pylink, which comes with the EyeLink SDK
+    try:
+        from lib.PsychoPyCustomDisplay import PsychoPyCustomDisplay
+    except ImportError:
+        print("pylink is not installed, so camera_image is not benchmarked.")
+    else:
+        builders["camera_image"] = get_camera_image(
+            PsychoPyCustomDisplay(settings["window"], tracker=None)
+        )
+
+    return builders
+
+
+def measure(build, window, n_frames):
+    build_times = np.zeros(n_frames)
+    flip_times = np.zeros(n_frames)
+
+    for frame in range(n_frames):
+        start = perf_counter()
+        build()
+        built = perf_counter()
+        window.flip()
+        flip_times[frame] = perf_counter() - built
+        build_times[frame] = built - start
+
+    return build_times * 1000, flip_times * 1000
+
+
+def summarise(times_in_ms):
+    return {
+        "median_ms": round(float(np.median(times_in_ms)), 4),
+        "p99_ms": round(float(np.percentile(times_in_ms, 99)), 4),
+    }
+
+
+def run(n_frames):
+    settings = get_settings(monitor, ".", "orange", offscreen=True)
+    results = {}
+
+    for name, build in get_builders(settings).items():
+        # Warm up first, so creating textures etc. isn't measured
+        measure(build, settings["window"], 10)
+
+        build_times, flip_times = measure(build, settings["window"], n_frames)
+        results[name] = {
+            "build_and_draw": summarise(build_times),
+            "flip": summarise(flip_times),
+        }
+
+    settings["window"].close()
+
+    return results
+
+
+def report(results):
+    print(f"{'builder':<26}{'median':>10}{'p99':>10}", end="")
+    for hz in REFRESH_RATES:
+        print(f"{f'p99 @{hz}Hz':>14}", end="")
+    print()
+
+    for name, result in results.items():
+        times = result["build_and_draw"]
+        print(
+            f"{name:<26}{times['median_ms']:>8.3f}ms{times['p99_ms']:>8.3f}ms", end=""
+        )
+        for hz in REFRESH_RATES:
+            print(f"{times['p99_ms'] / (1000 / hz) * 100:>13.1f}%", end="")
+        print()
+
+
+def check(results, baseline):
+    failed = []
+    budget = 1000 / max(REFRESH_RATES)
+
+    for name, result in results.items():
+        p99 = result["build_and_draw"]["p99_ms"]
+
+        if p99 > MAX_BUDGET_FRACTION * budget and name not in NOT_IN_TRIALS:
+            failed.append(f"{name}: p99 of {p99}ms uses too much of the frame budget")
+
+        if name in baseline:
+            baseline_p99 = baseline[name]["build_and_draw"]["p99_ms"]
+            if (
+                p99 > baseline_p99 * (1 + TOLERANCE)
+                and p99 - baseline_p99 > MIN_REGRESSION_MS
+            ):
+                failed.append(
+                    f"{name}: p99 of {p99}ms is slower than the baseline ({baseline_p99}ms)"
+                )
+
+    return failed
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark all screen builders.")
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save", action="store_true", help="store results as baseline")
+    parser.add_argument("--check", action="store_true", help="compare to baseline")
+    args = parser.parse_args()
+
+    # Don't benchmark for nothing
+    if args.check and not os.path.exists(args.baseline):
+        print(
+            f"There is no baseline at {args.baseline} yet, "
+            "run `python benchmark.py --save` first."
+        )
+        sys.exit(1)
+
+    results = run(args.frames)
+    report(results)
+
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as file:
+            failed = check(results, json.load(file))
+
+        for failure in failed:
+            print(failure)
+
+        sys.exit(1 if failed else 0)
@@ -6,47 +6,9 @@ To run the 'action coupled null-cue' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-import random
 from stimuli import show_text
 from response import wait_for_key
-
-
-def create_blocks(n_blocks):
-    if n_blocks % 2 != 0:
-        raise Exception("Expected number of blocks to be divisible by 2.")
-
-    # Generate an equal number of blocks of all types
-    block_types = ["respond 3", "respond not 3"]
-    blocks = (n_blocks // 2) * block_types
-
-    random.shuffle(blocks)
-
-    # Save list of sets of block numbers (in order) + block types
-    blocks = list(zip(range(1, n_blocks + 1), blocks))
-
-    return blocks
-
-
-def create_block(n_trials):
-    if n_trials % 12 != 0:
-        raise Exception("Expected number of trials to be divisible by 12.")
-
-    # Generate equal distribution of cue colours
-    cue_colours = n_trials // 3 * [1] + n_trials // 3 * [2] + n_trials // 3 * [3]
-
-    # Generate equal distribution of congruencies,
-    congruencies = n_trials // 6 * (
-        2 * ["congruent"] + 2 * ["incongruent"]
-    ) + n_trials // 3 * ["neutral"]
-
-    # Generate equal distribution of target locations
-    target_locations = n_trials // 2 * ["left", "right"]
-
-    # Create trial parameters for all trials
-    trials = list(zip(cue_colours, congruencies, target_locations))
-    random.shuffle(trials)
-
-    return trials
+from performance import PerformanceStats, QUANTILES
 
 
 def show_block_type(block_type, colour_assigned, settings, eyetracker):
@@ -69,11 +31,33 @@ def show_block_type(block_type, colour_assigned, settings, eyetracker):
     return False
 
 
-def block_break(current_block, n_blocks, hit, false_alarm, settings, eyetracker):
+def get_performance_summary(stats: PerformanceStats):
+    summary = f"Hit: {stats.hit_score}% \t False alarm: {stats.false_alarm_score}%"
+
+    median = QUANTILES.index(0.5)
+    if stats.n_trials:
+        summary += (
+            f"\nd': {stats.d_prime:.2f} \t "
+            f"Reaction time: {stats.reaction_time[median].value:.0f} ms \t "
+            f"Error: {stats.dial_error[median].value:.0f}°"
+        )
+
+    return summary
+
+
+def get_frame_timing_summary(stats: PerformanceStats):
+    return (
+        f"Dropped frames: {stats.dropped_frames} "
+        f"in {stats.trials_with_dropped_frames} of {stats.n_trials} trials"
+    )
+
+
+def block_break(current_block, n_blocks, stats, settings, eyetracker):
     blocks_left = n_blocks - current_block
 
     show_text(
-        f"Hit: {hit}% \t False alarm: {false_alarm}%\n\n"
+        f"{get_performance_summary(stats)}\n"
+        f"{get_frame_timing_summary(stats)}\n\n"
         f"You just finished block {current_block}, you {'only ' if blocks_left == 1 else ''}"
         f"have {blocks_left} block{'s' if blocks_left != 1 else ''} left. "
         "Take a break if you want to, but try not to move your head during this break."
@@ -94,9 +78,10 @@ def block_break(current_block, n_blocks, hit, false_alarm, settings, eyetracker)
     return False
 
 
-def long_break(n_blocks, hit, false_alarm, settings, eyetracker):
+def long_break(n_blocks, stats, settings, eyetracker):
     show_text(
-        f"Hit: {hit}% \t False alarm: {false_alarm}%\n\n"
+        f"{get_performance_summary(stats)}\n"
+        f"{get_frame_timing_summary(stats)}\n\n"
         f"You're halfway through! You have {n_blocks // 2} blocks left. "
         "Now is the time to take a longer break. Maybe get up, stretch, walk around."
         "\n\nPress SPACE whenever you're ready to continue again.",
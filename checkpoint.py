@@ -0,0 +1,73 @@
+"""
+This file contains the functions necessary for
+continuing a session that was interrupted halfway.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+After every trial, main.py saves where the session is in checkpoint_session_N.json.
+To continue session N at the next trial, run:
+
+   python main.py --resume N
+
+made by Anna van Harmelen, 2025
+"""
+
+import json
+import os
+import random
+
+
+def get_checkpoint_path(directory, session_number, testing=False):
+    return os.path.join(
+        directory,
+        f"checkpoint_session_{session_number}{'_test' if testing else ''}.json",
+    )
+
+
+def save_checkpoint(path, checkpoint: dict):
+    """
+    Replace the checkpoint in one go, so it's never half written.
+    The checkpoint is small, so this is cheap enough to do after every trial.
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(checkpoint, file)
+
+        # Make sure it's on disk before it replaces the old one, or a power cut
+        # could leave an empty checkpoint
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        raise Exception(f"There is no checkpoint to resume from at {path!r}.")
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def get_random_state(rng=random):
+    # Turns the state into lists, so it can be saved as json
+    version, state, gauss_next = rng.getstate()
+    return [version, list(state), gauss_next]
+
+
+def set_random_state(state, rng=random):
+    version, internal_state, gauss_next = state
+    rng.setstate((version, tuple(internal_state), gauss_next))
+
+
+def truncate_trial_file(path, size):
+    """
+    Cut off anything written to the session file after the checkpoint was saved,
+    e.g. the trial that was running when the session was interrupted.
+    Only looks at the size of the file, so the trials don't have to be read again.
+    """
+    if os.path.getsize(path) < size:
+        raise Exception(
+            f"{path!r} is shorter than when the checkpoint was saved, rebuild it "
+            "with datafile.py and start a new session instead."
+        )
+
+    os.truncate(path, size)
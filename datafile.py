@@ -0,0 +1,173 @@
+"""
+This file contains the functions necessary for
+saving trial data to disk while the experiment is running.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+To rebuild a session file that was cut off by a crash, run:
+
+   python datafile.py <path to data_session_N.csv>
+
+made by Anna van Harmelen, 2025
+"""
+
+import csv
+import os
+from argparse import ArgumentParser
+from time import perf_counter
+from timing import FLIP_LABELS
+
+# Make sure the data reaches the disk every so many trials
+FSYNC_EVERY = 4
+
+# Screens that are shown for a fixed number of frames
+PHASES = ["iti", "stimuli", "delay", "capture_cue", "probe_delay"]
+
+TRIAL_COLUMNS = [
+    "trial_number",
+    "block_type",
+    "block",
+    "start_time",
+    "end_time",
+    "previous_write_time_in_ms",
+    # stimuli characteristics
+    "ITI",
+    "stimuli_colours",
+    "capture_colour",
+    "capture_colour_id",
+    "trial_condition",
+    "left_orientation",
+    "right_orientation",
+    "target_bar",
+    "target_colour",
+    "target_orientation",
+    # trial report
+    "condition_code",
+    "stimuli_allocated",
+    "text_cache_misses",
+    # frame timing
+    "dropped_frames",
+    *[f"{label}_dropped_frames" for label in FLIP_LABELS],
+    *[f"{label}_duration_in_ms" for label in FLIP_LABELS[:-1]],
+    *[
+        f"{phase}_{frames}_frames"
+        for phase in PHASES
+        for frames in ["intended", "actual"]
+    ],
+    "stimuli_to_capture_cue_in_ms",
+    "capture_cue_to_probe_in_ms",
+    "idle_reaction_time_in_ms",
+    "response_time_in_ms",
+    "key_pressed",
+    "turns_made",
+    "premature_pressed",
+    "premature_key",
+    "premature_timing",
+    "cue_hit",
+    "cue_false_alarm",
+    "report_orientation",
+    "performance",
+    "absolute_difference",
+    "correct_key",
+    "signed_difference",
+]
+
+
+class TrialWriter:
+    """
+    Appends every trial to the session's .csv file as soon as it is finished,
+    so a crash only loses the trials that weren't synced to disk yet.
+
+    usage:
+
+       writer = TrialWriter(path)
+       writer.write(trial)  # in between trials, never during a stimulus phase
+       writer.sync()  # before saving a checkpoint
+       writer.close()
+    """
+
+    def __init__(self, path, columns=TRIAL_COLUMNS, fsync_every=FSYNC_EVERY) -> None:
+        self.path = path
+        self.fsync_every = fsync_every
+        self.n_written = 0
+        self.write_times_in_ms = []
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+
+        self.file = open(path, "a", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=columns, lineterminator="\n")
+
+        if new_file:
+            self.writer.writeheader()
+            self.file.flush()
+
+    @property
+    def size(self):
+        # In bytes, including the trials that weren't synced to disk yet
+        return self.file.tell()
+
+    @property
+    def last_write_time_in_ms(self):
+        return self.write_times_in_ms[-1] if self.write_times_in_ms else None
+
+    def write(self, trial: dict):
+        start = perf_counter()
+
+        # Raises a ValueError if the trial contains columns outside the schema
+        self.writer.writerow(trial)
+        self.file.flush()
+        self.n_written += 1
+
+        if self.n_written % self.fsync_every == 0:
+            os.fsync(self.file.fileno())
+
+        self.write_times_in_ms.append(round((perf_counter() - start) * 1000, 2))
+
+        return self.last_write_time_in_ms
+
+    def sync(self):
+        # Before saving a checkpoint, so its size is known to be on disk
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+def recover_trial_file(path, columns=TRIAL_COLUMNS):
+    """
+    Rebuild a session file that was cut off halfway through writing a trial,
+    by only keeping the header and the trials that were written completely.
+    Returns the number of recovered trials.
+    """
+    with open(path, newline="") as file:
+        content = file.read()
+
+    # A trial is only complete once its line ending has been written
+    complete, _, _ = content.rpartition("\n")
+    rows = list(csv.reader(complete.splitlines(keepends=True)))
+
+    if not rows or rows[0] != columns:
+        raise Exception(f"Expected {path!r} to start with the trial data header.")
+
+    trials = [row for row in rows[1:] if len(row) == len(columns)]
+
+    temporary_path = f"{path}.recovered"
+    with open(temporary_path, "w", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(columns)
+        writer.writerows(trials)
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(temporary_path, path)
+
+    return len(trials)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Rebuild a partially written session file.")
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    print(f"Recovered {recover_trial_file(args.path)} trials.")
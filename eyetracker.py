@@ -3,12 +3,32 @@ This file contains the functions necessary for
 connecting and using the eyetracker.
 To run the 'action coupled null-cue' experiment, see main.py.
 
+To check the .edf files of a session after transferring them, run:
+
+   python eyetracker.py <path to edf_session_N_P.json>
+
 made by Anna van Harmelen, 2025, using code by Rose Nasrawi
 """
 
 from lib import eyelinker
+from lib.gazebuffer import GazeSampleBuffer, SampleReader, ReplaySampleSource
 from psychopy import event
+from psychopy.core import monotonicClock
+from queue import Queue
+from argparse import ArgumentParser
+from stimuli import show_text
+import threading
+import hashlib
+import json
+import time
 import os
+import sys
+
+# How often to try transferring an .edf file before giving up
+TRANSFER_ATTEMPTS = 3
+
+# Longest name of an .edf file on the tracker, without extension
+EDF_NAME_LENGTH = 8
 
 
 class Eyelinker:
@@ -21,58 +41,397 @@ class Eyelinker:
 
        eyelinker = Eyelinker(participant, session, window, directory)
        eyelinker.calibrate()
+
+    While recording, all gaze samples are read into `eyelinker.samples`:
+
+       eyelinker.samples.samples_since(t)  # t in tracker time (ms)
+
+    Every block is recorded in its own .edf file, which is transferred in the
+    background during the break after it:
+
+       eyelinker.start()  # starts a new .edf file if the last one was ended
+       eyelinker.end_segment()  # at the end of every block
     """
 
-    def __init__(self, participant, session, window, directory) -> None:
+    def __init__(
+        self,
+        participant,
+        session,
+        window,
+        directory,
+        mock=False,
+        replay=None,
+        segment=0,
+    ) -> None:
         """
-        This also connects to the tracker
+        This also connects to the tracker, unless `mock` is True.
+        `replay` is a .npy file of recorded samples to fill `samples` with instead
+        (see lib.gazebuffer), for when there is no tracker.
+        `segment` is the number of the first .edf file, so a resumed session doesn't
+        overwrite the files of the run that was interrupted.
         """
+        self.participant = participant
+        self.session = session
         self.directory = directory
         self.window = window
-        self.tracker = eyelinker.EyeLinker(
-            window=window, eye="RIGHT", filename=f"{session}_{participant}.edf"
-        )
+        self.replay = replay
+        self.samples = GazeSampleBuffer()
+        self.sample_reader = None
+        self.recording = False
+        self.segment = segment
+
+        # Held for every call to the tracker, by all threads that use it
+        self.link_lock = threading.RLock()
+        if mock:
+            self.tracker = eyelinker.MockEyeLinker(
+                window=window,
+                eye="RIGHT",
+                filename=self.get_edf_filename(),
+                lock=self.link_lock,
+            )
+        else:
+            self.tracker = eyelinker.EyeLinker(
+                window=window,
+                eye="RIGHT",
+                filename=self.get_edf_filename(),
+                lock=self.link_lock,
+            )
         self.tracker.init_tracker()
+        self.tracker.samples = self.samples
+        self.triggers = TriggerDispatcher(self.tracker)
+        self.transfers = EdfTransfers(
+            self.tracker,
+            os.path.join(directory, f"edf_session_{session}_{participant}.json"),
+        )
+
+    def get_edf_filename(self):
+        """
+        Name of the current .edf file on the tracker, which only accepts names of up
+        to 8 characters (plus extension): session, participant and segment number in
+        base 36, with 3, 3 and 2 characters.
+        """
+        name = (
+            f"{to_base36(self.session, 3)}{to_base36(self.participant, 3)}"
+            f"{to_base36(self.segment, 2)}"
+        )
+        if len(name) > EDF_NAME_LENGTH:
+            raise Exception(
+                f"Session {self.session}, participant {self.participant} and segment "
+                f"{self.segment} don't fit in an .edf filename of {EDF_NAME_LENGTH} "
+                "characters."
+            )
+
+        return f"{name}.edf"
+
+    def get_edf_path(self):
+        # Where the current .edf file is saved once transferred, with a readable name
+        return os.path.join(
+            self.directory, f"{self.session}_{self.participant}_{self.segment}.edf"
+        )
+
+    def send_trigger(self, trigger, timestamp=None):
+        """
+        Send trigger without waiting for the eyetracker, `timestamp` should be the
+        time of the flip that showed the event (defaults to now).
+        """
+        self.triggers.send(trigger, timestamp)
+
+    def send_trial_id(self, trial_number):
+        # Numbers the trial in the .edf file, even if the session was resumed
+        self.triggers.send_message(f"TRIALID {trial_number}")
 
     def start(self):
+        if self.recording:
+            return
+
+        # Transferring needs the link to the tracker to itself
+        self.wait_for_transfers()
+
+        if not self.tracker.edf_open:
+            self.segment += 1
+            self.tracker.open_edf(self.get_edf_filename())
+
         self.tracker.start_recording()
+        self.recording = True
+        self.start_sample_reader()
+
+    def end_segment(self):
+        """
+        Stop recording and transfer the current .edf file in the background.
+        """
+        # Make sure all triggers are written before the recording stops
+        self.triggers.flush()
+        self.stop_sample_reader()
+
+        if self.recording:
+            self.tracker.stop_recording()
+            self.recording = False
+
+        if self.tracker.edf_open:
+            self.tracker.close_edf()
+
+            if not self.tracker.mock:
+                self.transfers.add(self.tracker.edf_filename, self.get_edf_path())
 
     def calibrate(self):
+        # Calibrating needs the link to the tracker to itself
+        self.stop_sample_reader()
+        self.wait_for_transfers()
         self.tracker.calibrate()
 
+        # The tracker setup stops the recording, start() has to restart it
+        self.recording = False
+
+    def wait_for_transfers(self):
+        while self.transfers.busy():
+            show_text(self.transfers.progress(), self.window)
+            self.window.flip()
+            time.sleep(0.1)
+
+    def start_sample_reader(self):
+        if self.sample_reader:
+            return
+
+        if self.replay:
+            source = ReplaySampleSource.from_file(self.replay)
+        elif not self.tracker.mock:
+            source = eyelinker.PylinkSampleSource(self.tracker.tracker)
+        else:
+            return
+
+        self.sample_reader = SampleReader(source, self.samples)
+
+    def stop_sample_reader(self):
+        if self.sample_reader:
+            self.sample_reader.stop()
+            self.sample_reader = None
+
     def stop(self):
-        os.chdir(self.directory)
+        self.end_segment()
+        self.triggers.stop()
+        self.wait_for_transfers()
+
+        # Try the segments that failed once more, now nothing else needs the link
+        self.transfers.retry_failed()
+        self.transfers.stop()
+
+        if self.transfers.failed:
+            print(
+                "These .edf files are still on the eyetracker, transfer them by hand: "
+                f"{', '.join(self.transfers.failed)}"
+            )
+
+
+class TriggerDispatcher:
+    """
+    Sends triggers to the eyetracker from a background thread, so the flips
+    never have to wait for the eyetracker.
 
-        self.tracker.stop_recording()
-        self.tracker.transfer_edf()
-        self.tracker.close_edf()
+    Every trigger is sent with the time that passed since its flip as a message
+    offset (EDF 'MSG <time> <offset> <text>'), so its time in the .edf file
+    is the time of the flip instead of the time it was written.
 
+    usage:
+
+       triggers = TriggerDispatcher(tracker)
+       triggers.send(trigger, window.flip())
+       triggers.send_message("TRIALID 1")  # any other message, in the same order
+       triggers.flush()  # waits until all triggers are sent
+       triggers.stop()  # sends all remaining triggers
+    """
+
+    def __init__(self, tracker, clock=monotonicClock.getTime) -> None:
+        """
+        `clock` should be the same clock as the one used for the flip timestamps,
+        window.flip() returns the time on psychopy's monotonicClock
+        """
+        self.tracker = tracker
+        self.clock = clock
+        self.queue = Queue()
 
-def get_trigger(block_type, frame, cue_colour, condition, target_position, settings):
-    # Determine condition marker
-    condition_marker = {1: 1, 2: 5, 3: 9}[settings["colours"].index(cue_colour) + 1]
+        self.thread = threading.Thread(target=self._dispatch, daemon=True)
+        self.thread.start()
+
+    def send(self, trigger, timestamp=None):
+        self.send_message(f"trig{trigger}", timestamp)
+
+    def send_message(self, text, timestamp=None):
+        self.queue.put((text, self.clock() if timestamp is None else timestamp))
+
+    def flush(self):
+        self.queue.join()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _dispatch(self):
+        while (item := self.queue.get()) is not None:
+            text, timestamp = item
+
+            offset = max(0, round((self.clock() - timestamp) * 1000))
+            self.tracker.send_message(f"{offset} {text}")
+            self.queue.task_done()
+
+
+class EdfTransfers:
+    """
+    Transfers finished .edf files from the eyetracker in a background thread.
+    Every file is first received as a .part.edf file, and only renamed once its
+    size matches what the tracker sent. Failed transfers are tried again, up to
+    TRANSFER_ATTEMPTS times. The size and sha256 of every transferred file are kept
+    in a manifest, to check the files later with `verify_edf_files`.
+
+    usage:
+
+       transfers = EdfTransfers(tracker, manifest_path)
+       transfers.add("1_12_3.edf", path)
+       transfers.progress()  # e.g. for showing on screen while waiting
+       transfers.stop()  # after transferring everything that was added
+    """
+
+    def __init__(
+        self, tracker, manifest_path, attempts=TRANSFER_ATTEMPTS, retry_delay=1
+    ) -> None:
+        self.tracker = tracker
+        self.manifest_path = manifest_path
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.queue = Queue()
+        self.current = None
+        self.n_transferred = 0
+        self.failed = []
+
+        self.manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as file:
+                self.manifest = json.load(file)
+
+        self.thread = threading.Thread(target=self._transfer, daemon=True)
+        self.thread.start()
+
+    def add(self, edf_filename, path):
+        self.queue.put((edf_filename, path))
+
+    def busy(self):
+        return self.queue.unfinished_tasks > 0
+
+    def progress(self):
+        if not self.current:
+            return "Saving eyetracker data..."
+
+        edf_filename, path = self.current
+        part_path = get_part_path(path)
+        received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        waiting = self.queue.unfinished_tasks - 1
+
+        return (
+            f"Saving eyetracker data: {edf_filename} ({received / 1e6:.1f} MB)"
+            f"{f', {waiting} more waiting' if waiting > 0 else ''}..."
+        )
+
+    def retry_failed(self):
+        failed, self.failed = self.failed, []
+        for edf_filename in failed:
+            self.add(edf_filename, self.manifest[edf_filename]["path"])
+        self.queue.join()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _transfer(self):
+        while (item := self.queue.get()) is not None:
+            self.current = item
+            edf_filename, path = item
+
+            for attempt in range(self.attempts):
+                try:
+                    self._transfer_file(edf_filename, path)
+                    self.n_transferred += 1
+                    break
+                except Exception as e:
+                    print(
+                        f"Transferring {edf_filename} failed ({e}), attempt {attempt + 1}"
+                    )
+                    time.sleep(self.retry_delay * (attempt + 1))
+            else:
+                self.failed.append(edf_filename)
+                self._save_manifest(edf_filename, path, status="failed")
+
+            self.current = None
+            self.queue.task_done()
+
+    def _transfer_file(self, edf_filename, path):
+        part_path = get_part_path(path)
+        size = self.tracker.transfer_edf(part_path, edf_filename)
+
+        if size is not None and os.path.getsize(part_path) != size:
+            raise Exception(
+                f"Received {os.path.getsize(part_path)} bytes, expected {size}."
+            )
+
+        os.replace(part_path, path)
+        self._save_manifest(edf_filename, path, status="transferred")
+
+    def _save_manifest(self, edf_filename, path, status):
+        self.manifest[edf_filename] = {"path": path, "status": status}
+
+        if status == "transferred":
+            self.manifest[edf_filename]["bytes"] = os.path.getsize(path)
+            self.manifest[edf_filename]["sha256"] = get_checksum(path)
+
+        with open(self.manifest_path, "w") as file:
+            json.dump(self.manifest, file, indent=2)
+
+
+def to_base36(number, width):
+    digits = ""
+    while number or not digits:
+        number, digit = divmod(int(number), 36)
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + digits
+
+    return digits.zfill(width)
+
+
+def get_part_path(path):
+    # The tracker only receives files ending in .edf
+    return path.removesuffix(".edf") + ".part.edf"
+
+
+def get_checksum(path):
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 20):
+            checksum.update(chunk)
+
+    return checksum.hexdigest()
+
+
+def verify_edf_files(manifest_path):
+    """
+    Returns the .edf files in the manifest that are missing, weren't transferred
+    or have changed since they were transferred.
+    """
+    with open(manifest_path) as file:
+        manifest = json.load(file)
 
-    condition_marker = (
-        condition_marker + {"congruent": 0, "incongruent": 2, "neutral": 0}[condition]
-    )
+    return [
+        edf_filename
+        for edf_filename, entry in manifest.items()
+        if entry["status"] != "transferred"
+        or not os.path.exists(entry["path"])
+        or get_checksum(entry["path"]) != entry["sha256"]
+    ]
 
-    if target_position == "right":
-        condition_marker += 1
 
-    if block_type == "respond not 3":
-        condition_marker += 10
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Check the transferred .edf files.")
+    parser.add_argument("manifest")
+    args = parser.parse_args()
 
-    if condition_marker > 20:
-        info = f"Created condition marker ({condition_marker}) doesn't exist. Received: {cue_colour}, {condition}, {target_position}, {block_type}"
-        raise Exception(info)
+    failed = verify_edf_files(args.manifest)
+    for edf_filename in failed:
+        print(f"{edf_filename} is missing, incomplete or changed")
 
-    # Return trigger (frame + condition marker)
-    return {
-        "stimuli_onset": "1",
-        "capture_cue_onset": "2",
-        "cue_response_onset": "3",
-        "probe_cue_onset": "4",
-        "response_onset": "5",
-        "response_offset": "6",
-        "feedback_onset": "7",
-    }[frame] + str(condition_marker)
+    sys.exit(1 if failed else 0)
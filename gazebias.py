@@ -0,0 +1,267 @@
+"""
+This file contains the functions necessary for
+computing the horizontal gaze bias towards the target bar, per condition,
+from the epochs cut by asc.py and the trial data in data_session_N.csv.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+To compute the group average of all sessions in participantinfo.csv, run:
+
+   python gazebias.py <directory> --frame capture_cue_onset --by trial_condition
+
+Add --degrees to get the gaze bias in degrees of visual angle instead of pixels.
+
+Results per session are cached on disk, so adding a session only computes that one.
+
+made by Anna van Harmelen, 2025
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+import warnings
+import numpy as np
+import pandas as pd
+from asc import CHANNELS, load_epochs
+from geometry import Geometry
+from set_up import get_monitor_and_dir
+
+FACTORS = ["trial_condition", "capture_colour_id", "block_type", "target_bar"]
+BASELINE = (-250, 0)  # in ms relative to the trigger
+
+# Change this whenever the computation changes, so old cached results aren't used
+CACHE_VERSION = 1
+
+
+def get_towardness(x, target_bar, baseline_rows):
+    """
+    Baseline-corrected horizontal gaze position (trials x time) towards the target
+    bar: positive values are towards the target, negative away from it.
+    """
+    baseline = np.nanmean(x[:, baseline_rows], axis=1, keepdims=True)
+    direction = np.where(target_bar == "right", 1, -1)[:, np.newaxis]
+
+    return (x - baseline) * direction
+
+
+def get_cells(trials):
+    """
+    Returns every combination of FACTORS that occurs, and for every trial which one.
+    """
+    grouped = trials.groupby(FACTORS, sort=True)
+
+    return grouped.size().reset_index()[FACTORS], grouped.ngroup().to_numpy()
+
+
+def compute_session(epochs_directory, trials_path, frame, baseline=BASELINE):
+    """
+    Sum and number of valid samples of the towardness time course per combination
+    of FACTORS, for one session. Sums can be added up to any split of the factors.
+    """
+    epochs = load_epochs(epochs_directory, frame)
+    with open(os.path.join(epochs_directory, "epochs.json")) as file:
+        start, end = json.load(file)[frame][0]["window"]
+    times = np.arange(start, end)
+
+    trials = pd.read_csv(trials_path)
+    trials = trials[trials.trial_number.isin(epochs.keys())]
+
+    x = np.stack([epochs[n][:, CHANNELS.index("x")] for n in trials.trial_number])
+    towardness = get_towardness(
+        x,
+        trials.target_bar.to_numpy(),
+        (times >= baseline[0]) & (times < baseline[1]),
+    )
+
+    cells, cell_of_trial = get_cells(trials)
+    valid = ~np.isnan(towardness)
+
+    sums = np.zeros((len(cells), len(times)))
+    counts = np.zeros((len(cells), len(times)))
+    np.add.at(sums, cell_of_trial, np.where(valid, towardness, 0))
+    np.add.at(counts, cell_of_trial, valid)
+
+    return {"times": times, "cells": cells, "sums": sums, "counts": counts}
+
+
+def get_cache_path(cache_directory, epochs_directory, trials_path, frame, baseline):
+    # Anything that changes the inputs, changes the cache file
+    key = [CACHE_VERSION, frame, list(baseline)]
+    for directory, filenames in [
+        (epochs_directory, sorted(os.listdir(epochs_directory))),
+        (os.path.dirname(trials_path), [os.path.basename(trials_path)]),
+    ]:
+        for filename in filenames:
+            status = os.stat(os.path.join(directory, filename))
+            key.append([filename, status.st_size, status.st_mtime_ns])
+
+    digest = hashlib.sha256(json.dumps(key).encode()).hexdigest()[:16]
+    name = os.path.basename(os.path.normpath(epochs_directory))
+
+    return os.path.join(cache_directory, f"{name}_{frame}_{digest}.npz")
+
+
+def load_session(epochs_directory, trials_path, frame, cache_directory, baseline):
+    """
+    compute_session, or its result from an earlier run.
+    """
+    cache_path = get_cache_path(
+        cache_directory, epochs_directory, trials_path, frame, baseline
+    )
+
+    if os.path.exists(cache_path):
+        with np.load(cache_path, allow_pickle=False) as cached:
+            return {
+                "times": cached["times"],
+                "cells": pd.DataFrame(dict(zip(FACTORS, cached["cells"].T))).astype(
+                    {"capture_colour_id": int}
+                ),
+                "sums": cached["sums"],
+                "counts": cached["counts"],
+            }
+
+    session = compute_session(epochs_directory, trials_path, frame, baseline)
+
+    os.makedirs(cache_directory, exist_ok=True)
+    np.savez(
+        cache_path,
+        times=session["times"],
+        cells=session["cells"].to_numpy(dtype=str),
+        sums=session["sums"],
+        counts=session["counts"],
+    )
+
+    return session
+
+
+def load_sessions(sessions, frame, cache_directory, baseline=BASELINE, processes=None):
+    """
+    load_session for every (epochs directory, trials path) in `sessions`, in parallel.
+    """
+    with ProcessPoolExecutor(processes) as executor:
+        return list(
+            executor.map(
+                load_session,
+                *zip(*sessions),
+                [frame] * len(sessions),
+                [cache_directory] * len(sessions),
+                [baseline] * len(sessions),
+            )
+        )
+
+
+def split_by(session, by):
+    """
+    The mean towardness time course of one session, per level of the factors in `by`.
+    """
+    cells = session["cells"].astype({"capture_colour_id": int})
+    groups = cells.groupby(by, sort=True).indices
+
+    with np.errstate(invalid="ignore"):
+        return {
+            level: session["sums"][rows].sum(axis=0)
+            / session["counts"][rows].sum(axis=0)
+            for level, rows in groups.items()
+        }
+
+
+def group_average(sessions, by):
+    """
+    Mean and standard error over sessions of the towardness time course, per level
+    of the factors in `by`. Every session counts equally.
+    """
+    splits = [split_by(session, by) for session in sessions]
+    levels = sorted(set().union(*splits))
+
+    average = {}
+
+    # Time points without any valid samples stay NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+
+        for level in levels:
+            time_courses = np.stack(
+                [split[level] for split in splits if level in split]
+            )
+            average[level] = {
+                "mean": np.nanmean(time_courses, axis=0),
+                "sem": (
+                    np.nanstd(time_courses, axis=0, ddof=1) / np.sqrt(len(time_courses))
+                    if len(time_courses) > 1
+                    else np.full(time_courses.shape[1], np.nan)
+                ),
+                "n_sessions": len(time_courses),
+            }
+
+    return average
+
+
+def find_sessions(directory):
+    """
+    (epochs directory, trials path) of every session in participantinfo.csv that
+    has been epoched with asc.py.
+    """
+    participants = pd.read_csv(os.path.join(directory, "participantinfo.csv"))
+    sessions = []
+
+    for participant, session in zip(
+        participants.participant_number, participants.session_number
+    ):
+        epochs_directory = os.path.join(
+            directory, f"epochs_session_{session}_{participant}"
+        )
+        trials_path = os.path.join(directory, f"data_session_{session}.csv")
+
+        if os.path.exists(os.path.join(epochs_directory, "epochs.json")):
+            sessions.append((epochs_directory, trials_path))
+
+    return sessions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Compute the gaze bias towards the target.")
+    parser.add_argument("directory")
+    parser.add_argument("--frame", default="capture_cue_onset")
+    parser.add_argument("--by", nargs="+", default=["trial_condition"])
+    parser.add_argument("--cache", default=None)
+    parser.add_argument("--output", default="gazebias.npz")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument(
+        "--degrees",
+        action="store_true",
+        help="in degrees of visual angle instead of pixels, for the lab monitor",
+    )
+    args = parser.parse_args()
+
+    sessions = load_sessions(
+        find_sessions(args.directory),
+        args.frame,
+        args.cache or os.path.join(args.directory, "gazebias_cache"),
+        processes=args.processes,
+    )
+    average = group_average(sessions, args.by)
+
+    unit = "pixels"
+    if args.degrees:
+        geometry = Geometry(get_monitor_and_dir(False)[0])
+        for result in average.values():
+            result["mean"] = geometry.pix2deg(result["mean"])
+            result["sem"] = geometry.pix2deg(result["sem"])
+        unit = "degrees"
+
+    np.savez(
+        args.output,
+        times=sessions[0]["times"],
+        **{
+            f"{'_'.join(map(str, np.atleast_1d(level)))}_{statistic}": result[statistic]
+            for level, result in average.items()
+            for statistic in ["mean", "sem"]
+        },
+    )
+
+    for level, result in average.items():
+        print(
+            f"{', '.join(map(str, np.atleast_1d(level)))}: {result['n_sessions']} sessions, "
+            f"mean towardness {np.nanmean(result['mean']):.2f} {unit}"
+        )
@@ -0,0 +1,100 @@
+"""
+This file contains the functions necessary for
+converting between degrees of visual angle and pixels, and for working out
+the size and position of every stimulus in pixels.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+All sizes are in degrees of visual angle.
+The Geometry of a monitor converts them to pixels once, when the experiment starts,
+so drawing a screen only has to look them up.
+
+made by Anna van Harmelen, 2025
+"""
+
+from math import degrees, atan2
+import numpy as np
+
+ECCENTRICITY = 6
+DOT_SIZE = 0.1  # radius of inner circle
+TOTAL_DOT_SIZE = 0.35  # radius of outer circle
+BAR_SIZE = [0.6, 4]  # width, height
+RESPONSE_DIAL_SIZE = 2  # radius of circle
+HANDLE_SIZE = RESPONSE_DIAL_SIZE / 15  # radius of the dial handles
+
+CIRCLE_EDGES = 1
+CIRCLE_LINE_WIDTH = 0.1
+
+BLOCK_SIGNAL_POSITION = (20, -11)
+FEEDBACK_HEIGHT = 0.7  # of the score after every trial
+PRACTICE_FEEDBACK_HEIGHT = 0.5  # of the score after every dial practice
+
+
+def get_degrees_per_pixel(monitor):
+    # The same for every pixel, taken from the width of the screen
+    return degrees(atan2(0.5 * monitor["width"], monitor["distance"])) / (
+        0.5 * monitor["resolution"][0]
+    )
+
+
+def deg2pix(deg, degrees_per_pixel):
+    """
+    Convert a number, or an array of any shape, from degrees to whole pixels.
+    """
+    pixels = np.rint(np.divide(deg, degrees_per_pixel))
+
+    if np.ndim(pixels) == 0:
+        return int(pixels)
+    return pixels.astype(int)
+
+
+def pix2deg(pix, degrees_per_pixel):
+    """
+    Convert a number, or an array of any shape, from pixels to degrees, e.g. gaze
+    positions. NaNs (missing samples) stay NaN.
+    """
+    return np.multiply(pix, degrees_per_pixel)
+
+
+class Geometry:
+    """
+    Every size and position of the stimuli, in pixels, for one monitor.
+
+    usage:
+
+       geometry = Geometry(monitor)
+       geometry.bar_positions["left"]  # (x, y)
+       geometry.dial_radius
+       geometry.pix2deg(gaze_x)  # for any other size, or a whole array of them
+    """
+
+    def __init__(self, monitor) -> None:
+        self.degrees_per_pixel = get_degrees_per_pixel(monitor)
+
+        self.eccentricity = self.deg2pix(ECCENTRICITY)
+        self.dot_radius = self.deg2pix(DOT_SIZE)
+        self.total_dot_radius = self.deg2pix(TOTAL_DOT_SIZE)
+        self.bar_width = self.deg2pix(BAR_SIZE[0])
+        self.bar_height = self.deg2pix(BAR_SIZE[1])
+        self.bar_positions = {
+            "left": (-self.eccentricity, 0),
+            "right": (self.eccentricity, 0),
+            "middle": (0, 0),
+        }
+
+        self.dial_radius = self.deg2pix(RESPONSE_DIAL_SIZE)
+        self.handle_radius = self.deg2pix(HANDLE_SIZE)
+        self.handle_positions = [(0, self.dial_radius), (0, -self.dial_radius)]
+        self.circle_edges = self.deg2pix(CIRCLE_EDGES)
+        self.circle_line_width = self.deg2pix(CIRCLE_LINE_WIDTH)
+
+        self.block_signal_position = tuple(
+            self.deg2pix(BLOCK_SIGNAL_POSITION).tolist()
+        )
+        self.feedback_position = (0, self.deg2pix(FEEDBACK_HEIGHT))
+        self.practice_feedback_position = (0, self.deg2pix(PRACTICE_FEEDBACK_HEIGHT))
+
+    def deg2pix(self, deg):
+        return deg2pix(deg, self.degrees_per_pixel)
+
+    def pix2deg(self, pix):
+        return pix2deg(pix, self.degrees_per_pixel)
@@ -0,0 +1,198 @@
+"""
+This file contains the functions necessary for
+running a full session without a screen, keyboard or eyetracker,
+with a simulated observer pressing the keys.
+To run a simulated session, use `python main.py --headless`, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import random
+from inputs import KeyEvent, ScriptedKeyBackend
+
+
+class SimulatedClock:
+    """
+    Simulated time in seconds, it only moves forward when the window flips
+    or the observer takes time to respond.
+    """
+
+    def __init__(self) -> None:
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+    def advance(self, seconds):
+        self.time += seconds
+
+
+class NullWindow:
+    """
+    Stands in for a psychopy.visual.Window, nothing is drawn and every flip
+    takes exactly one refresh of simulated time.
+    """
+
+    def __init__(self, monitor, clock) -> None:
+        self.size = monitor["resolution"]
+        self.color = (0, 0, 0)  # grey, in psychopy's rgb space
+        self.units = "pix"
+        self.frame_duration = 1 / monitor["Hz"]
+        self.clock = clock
+        self.n_flips = 0
+
+    def flip(self, clearBuffer=True):
+        self.clock.advance(self.frame_duration)
+        self.n_flips += 1
+
+        return self.clock()
+
+    def close(self):
+        pass
+
+
+class NullStim:
+    """
+    Stands in for any psychopy stimulus, it only remembers its attributes and
+    how often it was drawn.
+    """
+
+    def __init__(self, **attributes) -> None:
+        self.__dict__.update(attributes)
+        self.n_draws = 0
+
+    def draw(self):
+        self.n_draws += 1
+
+
+class SimulatedObserver:
+    """
+    Decides which keys to press, and when. It responds to the capture cue with
+    the m+z chord at `hit_rate` when it should and at `false_alarm_rate` when it
+    shouldn't, turns the dial towards the target orientation (with the right
+    key at `key_accuracy`) with normally distributed errors of `dial_error`
+    degrees and stops practising after `practice_trials` trials.
+    """
+
+    def __init__(
+        self,
+        seed=None,
+        hit_rate=0.8,
+        false_alarm_rate=0.1,
+        key_accuracy=0.95,
+        reaction_time=0.6,
+        dial_error=10,
+        practice_trials=3,
+        n_practice_parts=3,
+    ) -> None:
+        self.random = random.Random(seed)
+        self.hit_rate = hit_rate
+        self.false_alarm_rate = false_alarm_rate
+        self.key_accuracy = key_accuracy
+        self.reaction_time = reaction_time
+        self.dial_error = dial_error
+        self.practice_trials = practice_trials
+        self.practice_parts_left = n_practice_parts
+        self.trials_in_part = 0
+
+        self.target_orientation = 0
+        self.response_required = False
+
+    def observe(self, target_orientation, response_required):
+        self.target_orientation = target_orientation
+        self.response_required = response_required
+
+    def cue_response(self):
+        """
+        Returns the keys pressed in response to the capture cue, as (key, time
+        relative to probe onset) pairs.
+        """
+        p_press = self.hit_rate if self.response_required else self.false_alarm_rate
+
+        if self.random.random() >= p_press:
+            return []
+
+        press_time = -self.random.uniform(0.2, 1.4)
+        return [("m", press_time), ("z", press_time + self.random.uniform(0, 0.05))]
+
+    def wants_to_stop_practising(self):
+        if self.practice_parts_left and self.trials_in_part >= self.practice_trials:
+            self.practice_parts_left -= 1
+            self.trials_in_part = 0
+            return True
+
+        return False
+
+    def dial_response(self):
+        """
+        Returns the key to turn the dial with, the time until pressing it and
+        for how long to hold it.
+        """
+        self.trials_in_part += 1
+
+        correct_key = "m" if self.target_orientation > 0 else "z"
+        if self.random.random() < self.key_accuracy:
+            key = correct_key
+        else:
+            key = "z" if correct_key == "m" else "m"
+
+        # The dial turns a quarter circle per second
+        reported = abs(self.target_orientation) + self.random.gauss(0, self.dial_error)
+        hold_time = min(max(reported, 0), 90) / 90
+
+        return key, self.random.expovariate(1 / self.reaction_time), hold_time
+
+
+class SimulatedKeyBackend(ScriptedKeyBackend):
+    """
+    Key events of a SimulatedObserver, for an inputs.InputEngine. The response to
+    the capture cue is added as soon as the observer knows the trial, the dial is
+    turned (or the practice stopped) once its keys are waited for, and every other
+    screen is read in one second.
+    """
+
+    def __init__(self, observer: SimulatedObserver, clock) -> None:
+        super().__init__([], clock)
+        self.observer = observer
+
+    def observe(self, target_orientation, response_required):
+        # Called right before the probe onset, the cue was responded to before that
+        self.observer.observe(target_orientation, response_required)
+        self.add(
+            [
+                KeyEvent(name, True, self.clock() + press_time)
+                for name, press_time in self.observer.cue_response()
+            ]
+        )
+
+    def wait(self, key_list):
+        if not self.pending:
+            self.add(self.respond(key_list))
+
+        super().wait(key_list)
+
+    def respond(self, key_list):
+        now = self.clock()
+
+        # Waiting for the dial to be turned
+        if "z" in key_list and "m" in key_list:
+            if "q" in key_list and self.observer.wants_to_stop_practising():
+                return [KeyEvent("q", True, now)]
+
+            # Released once the dial has turned far enough, checked once per frame
+            key, reaction_time, hold_time = self.observer.dial_response()
+            return [
+                KeyEvent(key, True, now + reaction_time),
+                KeyEvent(key, False, now + reaction_time + hold_time),
+            ]
+
+        # Reading instructions
+        return [KeyEvent(key_list[0], True, now + 1)]
+
+
+def create_null_stimulus(stimulus_type, **attributes):
+    """
+    settings["create_stimulus"] when drawing to a NullWindow: creates a NullStim
+    instead of a psychopy stimulus.
+    """
+    return NullStim(**attributes)
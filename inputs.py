@@ -0,0 +1,178 @@
+"""
+This file contains the functions necessary for
+reading key presses and releases.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+Every key event is timestamped on the same clock as the window flips
+(psychopy.core.monotonicClock, or the simulated clock of a headless session), so
+reaction times are measured from the flip that showed the screen.
+
+made by Anna van Harmelen, 2025
+"""
+
+from collections import deque, namedtuple
+import time
+
+# How long to wait in between checking for new key events, in seconds
+POLL_INTERVAL = 0.001
+
+# `down` is True when the key was pressed, False when it was released
+KeyEvent = namedtuple("KeyEvent", ["name", "down", "time"])
+
+
+class InputEngine:
+    """
+    Collects the key events of a backend: a PsychopyKeyBackend during the
+    experiment, or a ScriptedKeyBackend to replay a fixed stream of key events.
+
+    usage:
+
+       backend = PsychopyKeyBackend(Keyboard(), clock.getLastResetTime())
+       keys = InputEngine(backend, clock.getTime)  # clock = core.monotonicClock
+       keys.clear()  # forget everything that happened before now
+       keys.presses(["m", "z"])  # all presses since the last clear
+       keys.wait_for_press(["space"])  # returns the KeyEvent
+       keys.released("m", since=t)  # the first release after t, or None
+       keys.take_log()  # every event since the last call, cleared or not
+    """
+
+    def __init__(self, backend, clock) -> None:
+        self.backend = backend
+        self.clock = clock
+        self.events = []
+        self.log = []
+
+    def poll(self):
+        events = self.backend.poll()
+        self.events.extend(events)
+        self.log.extend(events)
+        return self.events
+
+    def take_log(self):
+        self.poll()
+        log, self.log = self.log, []
+        return log
+
+    def clear(self):
+        self.poll()
+        self.events = []
+
+    def presses(self, key_list=None):
+        return [
+            event
+            for event in self.poll()
+            if event.down and (key_list is None or event.name in key_list)
+        ]
+
+    def released(self, key, since=None):
+        for event in self.poll():
+            if (
+                not event.down
+                and event.name == key
+                and (since is None or event.time >= since)
+            ):
+                return event
+
+        return None
+
+    def wait_for_press(self, key_list):
+        """
+        Wait until one of the keys in `key_list` is pressed, presses from before
+        calling this don't count.
+        """
+        n_seen = len(self.poll())
+
+        while True:
+            for event in self.events[n_seen:]:
+                if event.down and event.name in key_list:
+                    return event
+
+            n_seen = len(self.events)
+            self.backend.wait(key_list)
+            self.poll()
+
+    def check_quit(self):
+        if self.presses(["q"]):
+            raise KeyboardInterrupt()
+
+
+class PsychopyKeyBackend:
+    """
+    Reads a psychopy.hardware.keyboard.Keyboard. Its key timestamps are in the
+    psychopy.core.getTime timebase, while window.flip() returns the time on
+    core.monotonicClock. `zero` (monotonicClock.getLastResetTime()) is
+    subtracted from every key timestamp, so both are on the same clock.
+    """
+
+    def __init__(self, keyboard, zero=0) -> None:
+        self.keyboard = keyboard
+        self.zero = zero
+        self.held = set()  # (name, time pressed) of every key that is still down
+
+    def poll(self):
+        events = []
+
+        # Keys that are still down are left in the buffer, to catch their release
+        for key in self.keyboard.getKeys(waitRelease=False, clear=False):
+            if (key.name, key.tDown) not in self.held:
+                self.held.add((key.name, key.tDown))
+                events.append(KeyEvent(key.name, True, key.tDown - self.zero))
+
+        for key in self.keyboard.getKeys(waitRelease=True, clear=True):
+            if (key.name, key.tDown) in self.held:
+                self.held.remove((key.name, key.tDown))
+            else:
+                events.append(KeyEvent(key.name, True, key.tDown - self.zero))
+            events.append(
+                KeyEvent(key.name, False, key.tDown + key.duration - self.zero)
+            )
+
+        return sorted(events, key=lambda event: event.time)
+
+    def observe(self, target_orientation, response_required):
+        # Only a simulated observer needs to know the trial, see headless.py
+        pass
+
+    def wait(self, key_list):
+        time.sleep(POLL_INTERVAL)
+
+
+class ScriptedKeyBackend:
+    """
+    Replays a list of KeyEvents, every event as soon as the clock reaches its time.
+    With a simulated clock (see headless.py), waiting for a key moves the clock
+    straight to the next event instead of sleeping.
+    """
+
+    def __init__(self, events, clock) -> None:
+        self.clock = clock
+        self.pending = deque()
+        self.add(events)
+
+    def add(self, events):
+        self.pending = deque(
+            sorted([*self.pending, *events], key=lambda event: event.time)
+        )
+
+    def poll(self):
+        events = []
+        while self.pending and self.pending[0].time <= self.clock():
+            events.append(self.pending.popleft())
+
+        return events
+
+    def observe(self, target_orientation, response_required):
+        # The events are fixed in advance
+        pass
+
+    def wait(self, key_list):
+        if not self.pending:
+            raise Exception(f"Ran out of key events while waiting for {key_list}.")
+
+        delay = max(0, self.pending[0].time - self.clock())
+
+        # Only a simulated clock can be moved forward
+        if hasattr(self.clock, "advance"):
+            self.clock.advance(delay)
+        else:
+            time.sleep(min(delay, POLL_INTERVAL))
@@ -0,0 +1,223 @@
+"""
+This file contains the functions necessary for
+saving every key press and release of a trial, and scoring the responses to
+the capture cue again afterwards.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+During a session, the key events of every trial are appended to
+keys_session_N.bin, as raw KEY_EVENT_DTYPE records.
+To score the capture cue responses of all sessions in participantinfo.csv
+again, e.g. with a shorter window or without the m+z chord rule, run:
+
+   python keylog.py <directory> --window -1000 0 --rule any
+
+made by Anna van Harmelen, 2025
+"""
+
+from argparse import ArgumentParser
+import csv
+import os
+import numpy as np
+from datafile import FSYNC_EVERY
+
+# Every key is saved as its index in KEYS, all other keys as OTHER_KEY
+KEYS = ["z", "m", "q", "space", "c"]
+KEY_CODES = {key: code for code, key in enumerate(KEYS)}
+OTHER_KEY = 255
+
+KEY_EVENT_DTYPE = np.dtype(
+    [
+        ("trial", np.uint16),  # trial_number in data_session_N.csv
+        ("key", np.uint8),  # index into KEYS, or OTHER_KEY
+        ("down", np.bool_),  # False when the key was released
+        ("time_from_probe", np.float32),  # in ms
+        ("time_from_capture_cue", np.float32),  # in ms
+    ]
+)
+
+# The criteria used during the experiment, see response.evaluate_cue_response
+RULES = ["chord", "any"]
+WINDOW = (-1500, 0)  # in ms
+
+
+def get_key_event_array(events, trial_number, probe_onset, capture_cue_onset):
+    """
+    Turn the inputs.KeyEvents of one trial into KEY_EVENT_DTYPE records, with
+    times relative to the flips that showed the probe and the capture cue.
+    """
+    key_events = np.zeros(len(events), dtype=KEY_EVENT_DTYPE)
+    times = np.array([event.time for event in events], dtype=float)
+
+    key_events["trial"] = trial_number
+    key_events["key"] = [KEY_CODES.get(event.name, OTHER_KEY) for event in events]
+    key_events["down"] = [event.down for event in events]
+    key_events["time_from_probe"] = (times - probe_onset) * 1000
+    key_events["time_from_capture_cue"] = (times - capture_cue_onset) * 1000
+
+    return key_events
+
+
+class KeyLogWriter:
+    """
+    Appends the key events of every trial to the session's key log as soon as the
+    trial is finished, like datafile.TrialWriter does for the trial data.
+
+    usage:
+
+       writer = KeyLogWriter(path)
+       writer.write(key_events)  # a KEY_EVENT_DTYPE array, in between trials
+       writer.sync()  # before saving a checkpoint
+       writer.close()
+    """
+
+    def __init__(self, path, fsync_every=FSYNC_EVERY) -> None:
+        self.path = path
+        self.fsync_every = fsync_every
+        self.n_written = 0
+        self.file = open(path, "ab")
+
+    @property
+    def size(self):
+        # In bytes, including the trials that weren't synced to disk yet
+        return self.file.tell()
+
+    def write(self, key_events):
+        key_events.astype(KEY_EVENT_DTYPE, copy=False).tofile(self.file)
+        self.file.flush()
+        self.n_written += 1
+
+        if self.n_written % self.fsync_every == 0:
+            os.fsync(self.file.fileno())
+
+    def sync(self):
+        # Before saving a checkpoint, so its size is known to be on disk
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+def load_key_log(path):
+    return np.fromfile(path, dtype=KEY_EVENT_DTYPE)
+
+
+def score_cue_responses(
+    key_log, response_required, window=WINDOW, relative_to="probe", rule="chord"
+):
+    """
+    Decide for every trial again whether the capture cue was responded to.
+    `response_required` has one boolean per trial, for trial numbers 1, 2, ...
+    Only presses before the probe onset count, and only if they fall in `window`
+    (in ms, relative to the probe or the capture cue). With rule "chord" both m
+    and z have to be pressed right after each other, with "any" one of them is
+    enough. Returns the hits and false alarms, with one boolean per trial.
+    """
+    if rule not in RULES:
+        raise Exception(f"Expected rule to be one of {RULES}, not {rule!r}.")
+
+    # Presses while the probe was shown were turning the dial
+    presses = key_log[key_log["down"] & (key_log["time_from_probe"] < 0)]
+    presses = presses[np.lexsort((presses["time_from_probe"], presses["trial"]))]
+
+    times = presses[f"time_from_{relative_to}"]
+    in_window = (times > window[0]) & (times <= window[1])
+    is_response_key = np.isin(presses["key"], [KEY_CODES["m"], KEY_CODES["z"]])
+    counts = in_window & is_response_key
+
+    if rule == "chord":
+        # Like response.evaluate_cue_response, m and z have to be consecutive
+        chords = (
+            (presses["trial"][:-1] == presses["trial"][1:])
+            & counts[:-1]
+            & counts[1:]
+            & (presses["key"][:-1] != presses["key"][1:])
+        )
+        responded_trials = presses["trial"][:-1][chords]
+    else:
+        responded_trials = presses["trial"][counts]
+
+    response_required = np.asarray(response_required, dtype=bool)
+    responded = np.zeros(len(response_required), dtype=bool)
+    responded[responded_trials.astype(int) - 1] = True
+
+    return responded & response_required, responded & ~response_required
+
+
+def load_trials(trials_path):
+    """
+    Whether a response was required, and the recorded hits and false alarms,
+    with one boolean per trial for trial numbers 1, 2, ...
+    """
+    with open(trials_path, newline="") as file:
+        rows = list(csv.DictReader(file))
+
+    n_trials = max((int(row["trial_number"]) for row in rows), default=0)
+    trials = {
+        column: np.zeros(n_trials, dtype=bool)
+        for column in ["response_required", "cue_hit", "cue_false_alarm"]
+    }
+
+    for row in rows:
+        trial = int(row["trial_number"]) - 1
+        trials["response_required"][trial] = (row["block_type"] == "respond 3") == (
+            row["capture_colour_id"] == "3"
+        )
+        trials["cue_hit"][trial] = row["cue_hit"] == "True"
+        trials["cue_false_alarm"][trial] = row["cue_false_alarm"] == "True"
+
+    return trials
+
+
+def find_sessions(directory):
+    """
+    (session number, key log path, trials path) of every session in
+    participantinfo.csv that has a key log.
+    """
+    with open(os.path.join(directory, "participantinfo.csv"), newline="") as file:
+        session_numbers = [int(row["session_number"]) for row in csv.DictReader(file)]
+
+    sessions = []
+    for session in session_numbers:
+        key_log_path = os.path.join(directory, f"keys_session_{session}.bin")
+        trials_path = os.path.join(directory, f"data_session_{session}.csv")
+
+        if os.path.exists(key_log_path) and os.path.exists(trials_path):
+            sessions.append((session, key_log_path, trials_path))
+
+    return sessions
+
+
+def get_rate(responded, trials):
+    return responded.sum() / trials.sum() if trials.any() else np.nan
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Score the capture cue responses again.")
+    parser.add_argument("directory")
+    parser.add_argument("--window", nargs=2, type=float, default=WINDOW)
+    parser.add_argument(
+        "--relative-to", choices=["probe", "capture_cue"], default="probe"
+    )
+    parser.add_argument("--rule", choices=RULES, default="chord")
+    args = parser.parse_args()
+
+    print("session\thit (recorded)\tfalse alarm (recorded)")
+    for session, key_log_path, trials_path in find_sessions(args.directory):
+        trials = load_trials(trials_path)
+        hits, false_alarms = score_cue_responses(
+            load_key_log(key_log_path),
+            trials["response_required"],
+            args.window,
+            args.relative_to,
+            args.rule,
+        )
+        required = trials["response_required"]
+        recorded_hits = get_rate(trials["cue_hit"], required)
+        recorded_false_alarms = get_rate(trials["cue_false_alarm"], ~required)
+
+        print(
+            f"{session}\t{get_rate(hits, required):.0%} ({recorded_hits:.0%})\t"
+            f"{get_rate(false_alarms, ~required):.0%} ({recorded_false_alarms:.0%})"
+        )
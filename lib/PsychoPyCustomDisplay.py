@@ -10,11 +10,10 @@ PsychoPyCustomDisplay -- inherited from pylink.EyeLinkCustomDisplay. Defines how
  should be handled by psychopy.
 """
 
-import array
 import string
 import warnings
 
-import PIL
+import numpy as np
 
 import pylink
 
@@ -57,8 +56,10 @@ class PsychoPyCustomDisplay(pylink.EyeLinkCustomDisplay):
         self.window_adj = [i / 2 for i in self.window.size]
         self.tracker = tracker
 
-        self.pal = []
-        self.image_buffer = array.array('I')
+        # Camera image colours, as psychopy rgb values per palette index
+        self.pal = np.zeros((1, 3), dtype=np.float32)
+        self.image = np.zeros((0, 0, 3), dtype=np.float32)
+        self.image_stim = None
         
         if all(i >= 0.5 for i in self.window.color):
             self.text_color = (-1, -1, -1)
@@ -147,32 +148,32 @@ class PsychoPyCustomDisplay(pylink.EyeLinkCustomDisplay):
 
     def draw_image_line(self, width, line, totlines, buff):
         """Draws image from buffer."""
-        for i in buff:
-            if i >= len(self.pal):
-                self.image_buffer.append(self.pal[-1])
-            else:
-                self.image_buffer.append(self.pal[i])
+        if self.image.shape[:2] != (totlines, width):
+            self.image = np.zeros((totlines, width, 3), dtype=np.float32)
+            self.image_stim = None
 
-        if line == totlines:
-            bufferv = self.image_buffer.tostring()
-            image = PIL.Image.frombytes("RGBX", (width, totlines), bufferv)
+        # Look up the colours of the whole line at once. Psychopy images start at
+        # the bottom, so the first line goes in the last row.
+        indices = np.minimum(np.asarray(buff[:width], dtype=np.intp), len(self.pal) - 1)
+        self.image[totlines - line] = self.pal[indices]
 
-            psychopy_image = psychopy.visual.ImageStim(self.window, image=image)
+        if line == totlines:
+            # Re-use the same stimulus, only its texture changes
+            if self.image_stim is None:
+                self.image_stim = psychopy.visual.ImageStim(
+                    self.window, image=self.image, size=(width, totlines), units='pix'
+                )
+            else:
+                self.image_stim.image = self.image
 
-            psychopy_image.draw()
+            self.image_stim.draw()
             self.draw_cross_hair()
             self.image_title_object.draw()
             self.window.flip()
 
-            self.image_buffer = array.array('I')
-
     def set_image_palette(self, r, g, b):
         """Defines image colors."""
-        self.pal = []
-
-        # Code taken from pylink docs and altered
-        for r_, g_, b_ in zip(r, g, b):
-            self.pal.append((b_ << 16) | g_ << 8 | r_)
+        self.pal = np.stack([r, g, b], axis=1).astype(np.float32) / 127.5 - 1
 
     def exit_image_display(self):
         """Hides mouse when camera images are no longer visible."""
@@ -7,11 +7,11 @@ Rewrite by Baiwei Liu (lbwair@icloud.com)
 import os
 import sys
 import time
-import pygame
-from pygame.locals import *
+import threading
+import importlib.util
 
-import pylink as pl
-from .PsychoPyCustomDisplay import PsychoPyCustomDisplay
+import numpy as np
+from .gazebuffer import SAMPLE_DTYPE
 from math import sin, cos, pi, atan, sqrt, radians, hypot
 
 import psychopy.event
@@ -21,6 +21,37 @@ RIGHT_EYE = 1
 LEFT_EYE  = 0
 BINOCULAR = 2
 
+
+class _MissingModule:
+    """Stands in for a module that isn't installed, fails only once it is used."""
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attribute):
+        raise ImportError(f'{self.name} is needed to use the eyetracker, but is not installed.')
+
+
+def _lazy_import(name):
+    """Returns a module that is only loaded once one of its attributes is used.
+    This way pylink and pygame aren't loaded at all when the tracker is mocked.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return _MissingModule(name)
+
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+pl = _lazy_import('pylink')
+pygame = _lazy_import('pygame')
+
 def _try_connection():
     """Attempts to connect to eyetracker.
     Returns a bool indicating if a connection was made and an exception if applicable.
@@ -58,7 +89,7 @@ def _get_connection_failure_response():
     return psychopy.event.waitKeys(keyList=['r', 'q', 'd'])[0]
 
 
-def EyeLinker(window, filename, eye, text_color=None):
+def EyeLinker(window, filename, eye, text_color=None, lock=None):
     """A factory function that either returns a ConnectedEyeLinker or MockEyeLinker.
     Parameters:
     window -- A psychopy.visual.Window object
@@ -66,11 +97,12 @@ def EyeLinker(window, filename, eye, text_color=None):
     eye -- Which eye(s) to track, either "LEFT", "RIGHT" or "BOTH"
     text_color -- Defined using window color to black or white, but can be overwritten by
      providing a (r,g,b) tuple with values between -1 and 1
+    lock -- A threading.RLock that is held for every call to the tracker, see LockedLink
     """
     connected, e = _try_connection()
 
     if connected:
-        return ConnectedEyeLinker(window, filename, eye, text_color=None)
+        return ConnectedEyeLinker(window, filename, eye, text_color=None, lock=lock)
     else:
         _display_not_connected_text(window)
 
@@ -80,7 +112,7 @@ def EyeLinker(window, filename, eye, text_color=None):
         connected, e = _try_connection(window)
         if connected:
             window.flip()
-            return ConnectedEyeLinker(window, filename, eye, text_color=None)
+            return ConnectedEyeLinker(window, filename, eye, text_color=None, lock=lock)
         else:
             print('Could not connect to tracker. Select again.')
             response = _get_connection_failure_response()
@@ -93,9 +125,30 @@ def EyeLinker(window, filename, eye, text_color=None):
         print('Continuing with mock eyetracking. Eyetracking data will not be saved!')
         return MockEyeLinker(window, filename, eye, text_color=None)
 
+class LockedLink:
+    """Calls a pylink.EyeLink while holding `lock`.
+    pylink isn't thread-safe, and the link is used by the main thread, the trigger and
+    transfer threads (see eyetracker.py) and lib.gazebuffer.SampleReader.
+    """
+    def __init__(self, link, lock):
+        self.link = link
+        self.lock = lock
+
+    def __getattr__(self, name):
+        attribute = getattr(self.link, name)
+        if not callable(attribute):
+            return attribute
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attribute(*args, **kwargs)
+
+        return locked
+
+
 class ConnectedEyeLinker:
     """Returned if a connection is possible."""
-    def __init__(self, window, filename, eye, text_color=None):
+    def __init__(self, window, filename, eye, text_color=None, lock=None):
         """See Eyelinker factory function for parameter info."""
         if len(filename) > 12:
             raise ValueError(
@@ -113,9 +166,14 @@ class ConnectedEyeLinker:
         self.edf_open = False
         self.eye = eye
         self.resolution = tuple(window.size)
-        self.tracker = pl.EyeLink()
+        # Also needs pylink, so only imported when there is a tracker
+        from .PsychoPyCustomDisplay import PsychoPyCustomDisplay
+
+        self.lock = lock if lock is not None else threading.RLock()
+        self.tracker = LockedLink(pl.EyeLink(), self.lock)
         self.genv = PsychoPyCustomDisplay(self.window, self.tracker)
         self.mock = False
+        self.samples = None  # a GazeSampleBuffer, filled while recording
 
         if text_color is None:
             if all(i >= 0.5 for i in self.window.color):
@@ -226,32 +284,54 @@ class ConnectedEyeLinker:
         self.send_command(
             'validation_area_proportion %f %f' % settings['validation_area_proportion'])
 
-    def open_edf(self):
-        """Opens the edf file, must be called before tracker is initialized."""
+    def open_edf(self, filename=None):
+        """Opens the edf file, must be called before tracker is initialized.
+        Parameters:
+        filename -- optionally, a new edf file to continue recording in, same restrictions
+         as the filename passed to the Eyelinker factory function.
+        """
+        if filename:
+            self.edf_filename = filename
+
+        # The tracker can't open longer names
+        if len(self.edf_filename) > 12:
+            raise ValueError(
+                'EDF filename must be at most 12 characters long including the extension.')
+
         self.tracker.openDataFile(self.edf_filename)
         self.edf_open = True
+        self.send_message("DISPLAY_COORDS 0 0 %d %d" % self.resolution)
 
     def close_edf(self):
         """Closes the edf file at the end of the experiment."""
         self.tracker.closeDataFile()
         self.edf_open = False
 
-    def transfer_edf(self, new_filename=None):
+    def transfer_edf(self, new_filename=None, edf_filename=None):
         """Transfers the edf file to the computer running psychopy.
+        Returns the size of the file in bytes, as reported by the tracker.
         Parameters:
         new_filename -- optionally, a new filename for the edf file with no character restriciton.
+        edf_filename -- optionally, an earlier edf file on the tracker to transfer instead.
         """
+        if not edf_filename:
+            edf_filename = self.edf_filename
+
         if not new_filename:
-            new_filename = self.edf_filename
+            new_filename = edf_filename
 
         if new_filename[-4:] != '.edf':
             raise ValueError('Please include the .edf extension in the filename.')
 
-        # Prevents timeouts due to excessive printing
-        sys.stdout = open(os.devnull, "w")
-        self.tracker.receiveDataFile(self.edf_filename, new_filename)
-        sys.stdout = sys.__stdout__
+        # Its progress is printed as well. stdout isn't redirected to hide it,
+        # because this runs in a background thread and stdout is shared by all
+        size = self.tracker.receiveDataFile(edf_filename, new_filename)
+
+        if size is not None and size <= 0:
+            raise RuntimeError('Transferring %s failed (%d).' % (edf_filename, size))
+
         print(new_filename + ' has been transferred successfully.')
+        return size
 
     def setup_tracker(self):
         """Enters setup menu on eyelink computer."""
@@ -362,14 +442,19 @@ class ConnectedEyeLinker:
          with `tracker.gaze_data`
         See eyelinker_example.py for an example.
         """
-        sample = self.tracker.getNewestSample()
+        if self.samples is not None and len(self.samples):
+            sample = self.samples.newest()
+            left, right = (sample['left_x'], sample['left_y']), (sample['right_x'], sample['right_y'])
+        else:
+            sample = self.tracker.getNewestSample()
+            left, right = sample.getLeftEye().getGaze(), sample.getRightEye().getGaze()
 
         if self.eye == 'LEFT':
-            return sample.getLeftEye().getGaze()
+            return left
         elif self.eye == 'RIGHT':
-            return sample.getRightEye().getGaze()
+            return right
         else:
-            return (sample.getLeftEye().getGaze(), sample.getRightEye().getGaze())
+            return (left, right)
 
     @property
     def pupil_size(self):
@@ -380,14 +465,19 @@ class ConnectedEyeLinker:
          info.
         See eyelinker_example.py for an example.
         """
-        sample = self.tracker.getNewestSample()
+        if self.samples is not None and len(self.samples):
+            sample = self.samples.newest()
+            left, right = sample['left_pupil'], sample['right_pupil']
+        else:
+            sample = self.tracker.getNewestSample()
+            left, right = sample.getLeftEye().getPupilSize(), sample.getRightEye().getPupilSize()
 
         if self.eye == 'LEFT':
-            return sample.getLeftEye().getPupilSize()
+            return left
         elif self.eye == 'RIGHT':
-            return sample.getRightEye().getPupilSize()
+            return right
         else:
-            return (sample.getLeftEye().getPupilSize(), sample.getRightEye().getPupilSize())
+            return (left, right)
 
     def set_offline_mode(self):
         """Sets tracker to offline mode."""
@@ -461,6 +551,55 @@ class ConnectedEyeLinker:
         self.stop_recording()
         print('Basic functionality tests passed...')
 
+class PylinkSampleSource:
+    """Reads all samples that arrived over the link since the last read.
+    Used by lib.gazebuffer.SampleReader, so events (see check_sacc) aren't available
+    over the link while it is running.
+    Parameters:
+    tracker -- a LockedLink to a pylink.EyeLink that is recording
+    max_samples -- the most samples to read at once
+    """
+    def __init__(self, tracker, max_samples=1000):
+        self.tracker = tracker
+        self.samples = np.full(max_samples, np.nan, dtype=SAMPLE_DTYPE)
+
+    def read(self):
+        # Hold the lock once for all samples, instead of for every call
+        with self.tracker.lock:
+            n = self._read(self.tracker.link)
+
+        # Copy, as the same array is used for the next read
+        samples = self.samples[:n].copy()
+        for field in SAMPLE_DTYPE.names[1:]:
+            samples[field][samples[field] == pl.MISSING_DATA] = np.nan
+
+        return samples
+
+    def _read(self, link):
+        n = 0
+        while n < len(self.samples):
+            data_type = link.getNextData()
+            if not data_type:
+                break
+            if data_type != pl.SAMPLE_TYPE:
+                continue
+
+            sample = link.getFloatData()
+            row = self.samples[n]
+            row['time'] = sample.getTime()
+            for eye, is_sample, get_eye in [
+                ('left', sample.isLeftSample, sample.getLeftEye),
+                ('right', sample.isRightSample, sample.getRightEye),
+            ]:
+                if is_sample():
+                    row[eye + '_x'], row[eye + '_y'] = get_eye().getGaze()
+                    row[eye + '_pupil'] = get_eye().getPupilSize()
+                else:
+                    row[eye + '_x'] = row[eye + '_y'] = row[eye + '_pupil'] = np.nan
+            n += 1
+
+        return n
+
 def topLeftToCenter(pointXY, screenXY, flipY=False):
     """
     Takes a coordinate given in topLeft reference frame and transforms it
@@ -525,7 +664,9 @@ def centerToTopLeft(pointXY, screenXY, flipY=False):
 
 def check_sacc(Dis_sacc, startime = 0):
 
-    ''' check for eye movements'''
+    ''' check for eye movements
+    Only handles one event per call, see lib.gazeevents for detecting saccades in all
+    buffered samples at once.'''
     
     # check recording eye
     eye_used = pl.getEYELINK().eyeAvailable(); #determine which eye(s) are available 
@@ -551,7 +692,9 @@ def check_sacc(Dis_sacc, startime = 0):
 
 def check_fix(start_loc, fix_loc, acceptableDev, Dis_for_sacc, scnSize, startime = 0):
 
-    ''' check for eye fixation for a spatial location'''
+    ''' check for eye fixation for a spatial location
+    Only checks the newest sample, see lib.gazeevents.detect_fixation_events for checking
+    all buffered samples at once.'''
     
     eye_used = pl.getEYELINK().eyeAvailable();
     fix_loc = centerToTopLeft(fix_loc,scnSize )
@@ -589,15 +732,15 @@ def checkKeyEvent(KEYS_ALLOWED,TERMINATE_UPON_RESP,startime):
     ev = pygame.event.get()
     gotKey = False; escapePressed = False
     for keyp in ev:
-        if (keyp.type == KEYDOWN):
+        if (keyp.type == pygame.KEYDOWN):
             keycode = keyp.key
-            if keycode == K_KP_MULTIPLY and (keycode in KEYS_ALLOWED):
+            if keycode == pygame.K_KP_MULTIPLY and (keycode in KEYS_ALLOWED):
                 pygame.quit(); sys.exit();
             if (TERMINATE_UPON_RESP == True) and (keycode in KEYS_ALLOWED):
                 gotKey   = True
                 respKey  = pygame.key.name(keycode)
                 respTime = pl.getEYELINK().trackerTime()
-            if keycode == K_ESCAPE: escapePressed = True
+            if keycode == pygame.K_ESCAPE: escapePressed = True
 
     if gotKey:
         return [gotKey, escapePressed, respKey, startime, respTime, respTime-startime]
@@ -630,7 +773,7 @@ def _mock_func(*args, **kwargs):
 
 class MockEyeLinker:
     """Returned if a connection could not be made, useful for debugging away from the trackers."""
-    def __init__(self, window, filename, eye, text_color=None):
+    def __init__(self, window, filename, eye, text_color=None, lock=None):
         self.window = window
         self.edf_filename = filename
         self.edf_open = False
@@ -0,0 +1,154 @@
+"""A preallocated ring buffer for gaze samples, filled from a background thread.
+
+Samples are kept in tracker time (ms), with the gaze position (pixels) and pupil size
+of both eyes. Eyes that aren't tracked are NaN.
+
+usage:
+
+   buffer = GazeSampleBuffer()
+   reader = SampleReader(source, buffer)  # e.g. PylinkSampleSource or ReplaySampleSource
+   ...
+   samples = buffer.samples_since(t)  # a view, no copy
+   reader.stop()
+"""
+import threading
+import time
+
+import numpy as np
+
+SAMPLE_DTYPE = np.dtype([
+    ('time', 'f8'),
+    ('left_x', 'f4'),
+    ('left_y', 'f4'),
+    ('left_pupil', 'f4'),
+    ('right_x', 'f4'),
+    ('right_y', 'f4'),
+    ('right_pupil', 'f4'),
+])
+
+# One minute of samples at 1000 Hz
+SAMPLE_CAPACITY = 60000
+
+
+class GazeSampleBuffer:
+    """Keeps the most recent `capacity` samples.
+
+    Every sample is written twice, at i and i + capacity, so the most recent samples are
+    always one contiguous slice and can be returned as a view instead of a copy.
+    There should only be one thread pushing samples. A view stays valid until another
+    `capacity` samples have been pushed, copy it to keep it for longer.
+    """
+    def __init__(self, capacity=SAMPLE_CAPACITY):
+        self.capacity = capacity
+        self.data = np.full(2 * capacity, np.nan, dtype=SAMPLE_DTYPE)
+        self.n_samples = 0
+
+    def __len__(self):
+        return min(self.n_samples, self.capacity)
+
+    def push(self, samples):
+        """Appends an array of SAMPLE_DTYPE samples, sorted by time."""
+        samples = samples[-self.capacity:]
+        positions = (self.n_samples + np.arange(len(samples))) % self.capacity
+
+        self.data[positions] = samples
+        self.data[positions + self.capacity] = samples
+
+        # Only count the samples once they have been written completely
+        self.n_samples += len(samples)
+
+    def latest(self, n=None):
+        """A view of the `n` most recent samples (all available samples by default)."""
+        n_samples = self.n_samples
+        n = min(n_samples, self.capacity) if n is None else min(n, n_samples, self.capacity)
+
+        start = (n_samples - n) % self.capacity
+        return self.data[start:start + n]
+
+    def newest(self):
+        """The most recent sample, or None if there are no samples yet."""
+        if not self.n_samples:
+            return None
+
+        return self.data[(self.n_samples - 1) % self.capacity].copy()
+
+    def samples_since(self, t):
+        """A view of all samples at or after tracker time `t` (ms)."""
+        samples = self.latest()
+        return samples[np.searchsorted(samples['time'], t):]
+
+    def save(self, path):
+        """Saves all available samples as .npy file, e.g. to replay them later."""
+        np.save(path, self.latest())
+
+
+class ReplaySampleSource:
+    """Replays recorded samples at the pace they were recorded in.
+
+    Parameters:
+    samples -- an array of SAMPLE_DTYPE samples, e.g. saved with GazeSampleBuffer.save
+    speed -- how much faster than real time to replay
+    clock -- returns the current time in seconds
+    """
+    def __init__(self, samples, speed=1.0, clock=time.perf_counter):
+        self.samples = samples
+        self.speed = speed
+        self.clock = clock
+        self.start = None
+        self.position = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(np.load(path), **kwargs)
+
+    def read(self):
+        """Returns all samples that would have arrived since the last read."""
+        if self.start is None:
+            self.start = self.clock()
+
+        if not len(self.samples):
+            return self.samples
+
+        elapsed = (self.clock() - self.start) * 1000 * self.speed
+        end = np.searchsorted(
+            self.samples['time'], self.samples['time'][0] + elapsed, side='right')
+
+        samples = self.samples[self.position:end]
+        self.position = max(self.position, end)
+
+        return samples
+
+    @property
+    def finished(self):
+        return self.position >= len(self.samples)
+
+
+class SampleReader:
+    """Moves samples from a source into a GazeSampleBuffer on a background thread.
+
+    Parameters:
+    source -- anything with a `read()` method returning an array of new samples
+    buffer -- the GazeSampleBuffer to fill
+    interval -- time to wait (in seconds) whenever the source has no new samples
+    """
+    def __init__(self, source, buffer, interval=0.001):
+        self.source = source
+        self.buffer = buffer
+        self.interval = interval
+        self.stopped = threading.Event()
+
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _read(self):
+        while not self.stopped.is_set():
+            samples = self.source.read()
+
+            if len(samples):
+                self.buffer.push(samples)
+            else:
+                self.stopped.wait(self.interval)
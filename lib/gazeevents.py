@@ -0,0 +1,147 @@
+"""Vectorised detection of saccades and fixation events in arrays of gaze samples.
+
+Works on arrays of lib.gazebuffer.SAMPLE_DTYPE samples, either offline on a whole
+recording or online on the samples buffered while recording (see GazeEventDetector).
+Positions are in tracker pixels, with (0, 0) in the top left of the screen.
+
+usage:
+
+   saccades = detect_saccades(samples, eye='right', min_amplitude=30)
+   events = detect_fixation_events(samples, fix_loc, start_loc, acceptable_dev, saccade_distance)
+
+   detector = GazeEventDetector(eyelinker.samples, min_amplitude=30)
+   new_saccades = detector.update()  # e.g. once per frame
+"""
+import numpy as np
+
+SACCADE = 1
+LEFT_START = 2  # gaze moved away from the start location
+ON_TARGET = 3  # gaze arrived within the acceptable deviation of the target
+
+EVENT_DTYPE = np.dtype([
+    ('type', 'u1'),
+    ('start_time', 'f8'),
+    ('end_time', 'f8'),
+    ('start_x', 'f4'),
+    ('start_y', 'f4'),
+    ('end_x', 'f4'),
+    ('end_y', 'f4'),
+    ('amplitude', 'f4'),
+    ('peak_velocity', 'f4'),
+])
+
+# In pixels per ms, about 30 degrees per second on the lab screen
+VELOCITY_THRESHOLD = 1.3
+
+
+def gaze(samples, eye):
+    """Returns the x and y arrays of `eye` ('left' or 'right')."""
+    return samples[eye + '_x'], samples[eye + '_y']
+
+
+def distance_from(samples, point, eye='right'):
+    """Distance (pixels) of every sample to `point`, NaN where the eye was lost."""
+    x, y = gaze(samples, eye)
+    return np.hypot(x - point[0], y - point[1])
+
+
+def centre_to_top_left(points, screen_size):
+    """Vectorised lib.eyelinker.centerToTopLeft for an (..., 2) array of positions,
+    from the experiment's centre-based pixels to tracker pixels."""
+    points = np.asarray(points, dtype=float)
+    return np.stack([points[..., 0] + screen_size[0] / 2,
+                     screen_size[1] / 2 - points[..., 1]], axis=-1)
+
+
+def _runs(mask):
+    """Start and end (exclusive) indices of every run of True values in `mask`."""
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_saccades(samples, eye='right', velocity_threshold=VELOCITY_THRESHOLD,
+                    min_amplitude=0):
+    """Finds all saccades, as runs of samples faster than `velocity_threshold` (pixels
+    per ms), with an amplitude of at least `min_amplitude` pixels.
+    Returns an array of EVENT_DTYPE events.
+    """
+    if len(samples) < 2:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+
+    x, y = gaze(samples, eye)
+    time = samples['time']
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        velocity = np.hypot(np.diff(x), np.diff(y)) / np.diff(time)
+
+    # Sample i to i + 1 is part of the saccade when velocity[i] is above threshold
+    starts, ends = _runs(velocity > velocity_threshold)
+
+    events = np.zeros(len(starts), dtype=EVENT_DTYPE)
+    events['type'] = SACCADE
+    events['start_time'], events['end_time'] = time[starts], time[ends]
+    events['start_x'], events['start_y'] = x[starts], y[starts]
+    events['end_x'], events['end_y'] = x[ends], y[ends]
+    events['amplitude'] = np.hypot(x[ends] - x[starts], y[ends] - y[starts])
+    if len(starts):
+        events['peak_velocity'] = np.maximum.reduceat(np.nan_to_num(velocity), starts)
+
+    return events[events['amplitude'] >= min_amplitude]
+
+
+def detect_fixation_events(samples, fix_loc, start_loc, acceptable_dev, saccade_distance,
+                           eye='right'):
+    """Like lib.eyelinker.check_fix, for all samples at once: finds the first sample that
+    is more than `saccade_distance` away from `start_loc` (LEFT_START) and the first
+    sample within `acceptable_dev` of `fix_loc` (ON_TARGET), all in tracker pixels.
+    Returns an array of EVENT_DTYPE events, in the order they happened.
+    """
+    events = []
+    x, y = gaze(samples, eye)
+
+    for event_type, found in [
+        (LEFT_START, distance_from(samples, start_loc, eye) > saccade_distance),
+        (ON_TARGET, distance_from(samples, fix_loc, eye) < acceptable_dev),
+    ]:
+        if found.any():
+            i = np.argmax(found)
+            events.append((event_type, samples['time'][i], samples['time'][i],
+                           x[i], y[i], x[i], y[i], 0, 0))
+
+    events = np.array(events, dtype=EVENT_DTYPE)
+    return events[np.argsort(events['start_time'], kind='stable')]
+
+
+class GazeEventDetector:
+    """Detects saccades online, in the samples that arrived in a GazeSampleBuffer since
+    the last update. A saccade is only returned once it has ended.
+    Parameters:
+    buffer -- a lib.gazebuffer.GazeSampleBuffer that is being filled
+    eye, velocity_threshold, min_amplitude -- see detect_saccades
+    """
+    def __init__(self, buffer, eye='right', velocity_threshold=VELOCITY_THRESHOLD,
+                 min_amplitude=0):
+        self.buffer = buffer
+        self.eye = eye
+        self.velocity_threshold = velocity_threshold
+        self.min_amplitude = min_amplitude
+        self.since = -np.inf
+
+    def update(self):
+        samples = self.buffer.samples_since(self.since)
+        if len(samples) < 2:
+            return np.zeros(0, dtype=EVENT_DTYPE)
+
+        saccades = detect_saccades(samples, self.eye, self.velocity_threshold)
+
+        # A saccade that ends at the last sample may still be going on, look at it again
+        # next time. Otherwise the next update starts at the last sample, for its velocity.
+        last_time = samples['time'][-1]
+        ongoing = saccades['end_time'] == last_time
+        if ongoing.any():
+            self.since = saccades['start_time'][ongoing][0]
+            saccades = saccades[~ongoing]
+        else:
+            self.since = last_time
+
+        return saccades[saccades['amplitude'] >= self.min_amplitude]
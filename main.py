@@ -5,31 +5,28 @@ made by Anna van Harmelen, 2025
 see README.md for instructions if needed
 """
 
-# Import necessary stuff
-from psychopy import core
-import pandas as pd
-from participantinfo import get_participant_details
+# Import only what's needed to ask for the participant's age, everything else is
+# imported in main(), so the participant doesn't have to wait for it
+from startup import StartupProfile
+from participantinfo import (
+    ParticipantRegistry,
+    get_participant_details,
+    COLOUR_OPTIONS,
+)
 from set_up import get_monitor_and_dir, get_settings
-from eyetracker import Eyelinker
-from argparse import ArgumentParser
-from trial import (
-    determine_response_required,
-    generate_stimuli_characteristics,
-    single_trial,
+from checkpoint import (
+    get_checkpoint_path,
+    load_checkpoint,
+    save_checkpoint,
+    get_random_state,
+    set_random_state,
+    truncate_trial_file,
 )
+from argparse import ArgumentParser
 from time import time
-from numpy import mean
-from practice import practice
 import datetime as dt
-from block import (
-    create_blocks,
-    create_block,
-    show_block_type,
-    block_break,
-    long_break,
-    finish,
-    quick_finish,
-)
+import os
+import tempfile
 import traceback
 
 N_BLOCKS = 16
@@ -39,71 +36,246 @@ TRIALS_PER_BLOCK = 48
 def main():
     """
     Data formats / storage:
-     - eyetracking data saved in one .edf file per session
+     - eyetracking data saved in one .edf file per block (and one for the practice)
      - all trial data saved in one .csv per session
-     - subject data in one .csv (for all sessions combined)
+     - every key press and release saved in one .bin per session (see keylog.py)
+     - subject data in one .sqlite registry (for all sessions combined),
+       exported to one .csv
+     - where the session is saved after every trial, in one .json per session
+       (to continue an interrupted session with --resume)
     """
+    profile = StartupProfile()
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="run the full session without screen, keyboard or eyetracker, "
+        "with a simulated observer giving all responses, in a new scratch "
+        "directory unless --directory is given (no participant is registered)",
+    )
+    parser.add_argument("--seed", type=int, help="seed of the simulated observer")
+    parser.add_argument("--directory", help="where to find and save all data")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="report how long every import and set-up step takes, then quit "
+        "before calibrating (no participant is registered)",
+    )
+    parser.add_argument(
+        "--resume",
+        type=int,
+        metavar="SESSION",
+        help="continue an interrupted session at the trial after its last checkpoint",
+    )
+    parser.add_argument(
+        "--timeline",
+        help="show the phases of every trial as in this file (see timeline.json)",
+    )
+    args = parser.parse_args()
 
     # Set whether this is a test run or not
     testing = False
 
     # Get monitor and directory information
     monitor, directory = get_monitor_and_dir(testing)
+    if args.directory:
+        directory = args.directory
+    elif args.headless:
+        # Keep simulated sessions out of the lab's data
+        directory = tempfile.mkdtemp(prefix="headless_")
+        print(f"Saving the headless session in {directory}")
+
+    # Get participant details and register them straight away
+    registry = None
+    if not args.headless:
+        with profile.stage("participant registry"):
+            registry = ParticipantRegistry(directory)
+    checkpoint = None
+    if args.resume:
+        # Continue with the participant of the interrupted session
+        checkpoint = load_checkpoint(
+            get_checkpoint_path(directory, args.resume, testing)
+        )
+        participant = {
+            "participant_number": checkpoint["participant_number"],
+            "session_number": args.resume,
+        }
+        colour_assignment = checkpoint["colour_assignment"]
+    elif args.profile_startup:
+        participant = {"participant_number": 0, "session_number": 0}
+        colour_assignment = COLOUR_OPTIONS[0]
+    elif args.headless:
+        participant = {"participant_number": 0, "session_number": 1}
+        colour_assignment = COLOUR_OPTIONS[0]
+    else:
+        profile.mark("age prompt")
+        participant, colour_assignment = get_participant_details(registry, testing)
+    session_number = participant["session_number"]
+
+    # Now import everything else
+    with profile.stage("import psychopy"):
+        from psychopy import core
+    with profile.stage("import trial"):
+        from trial import (
+            determine_response_required,
+            stimuli_characteristics_from_schedule,
+            single_trial,
+        )
+    with profile.stage("import schedule"):
+        from schedule import (
+            compile_schedule,
+            get_schedule_seed,
+            save_schedule,
+            load_schedule,
+            get_blocks,
+            get_block,
+        )
+    with profile.stage("import practice"):
+        from practice import practice
+    with profile.stage("import datafile"):
+        from datafile import TrialWriter
+    with profile.stage("import keylog"):
+        from keylog import KeyLogWriter, get_key_event_array
+    with profile.stage("import performance"):
+        from performance import PerformanceStats
+    with profile.stage("import headless"):
+        from headless import SimulatedObserver
+    with profile.stage("import timeline"):
+        from timeline import TrialPlan
+    with profile.stage("import block"):
+        from block import (
+            show_block_type,
+            block_break,
+            long_break,
+            finish,
+            quick_finish,
+        )
 
-    # Get participant details and save in same file as before
-    old_participants = pd.read_csv(
-        rf"{directory}\participantinfo.csv",
-        dtype={
-            "participant_number": int,
-            "session_number": int,
-            "age": int,
-            "trials_completed": str,
-            "colour_assignment": str,
-        },
-    )
-    new_participants, colour_assignment = get_participant_details(
-        old_participants, testing
+    # Initialise set-up
+    observer = SimulatedObserver(seed=args.seed) if args.headless else None
+    settings = get_settings(
+        monitor,
+        directory,
+        colour_assignment,
+        observer=observer,
+        profile=profile,
+        colours=checkpoint["colours"] if checkpoint else None,
+        timeline=args.timeline,
     )
 
-    # Initialise set-up
-    settings = get_settings(monitor, directory, colour_assignment)
+    # Connect to eyetracker
+    if not testing:
+        with profile.stage("import eyetracker"):
+            from eyetracker import Eyelinker
+        with profile.stage("tracker connect"):
+            eyelinker = Eyelinker(
+                participant["participant_number"],
+                session_number,
+                settings["window"],
+                settings["directory"],
+                mock=args.headless,
+                segment=checkpoint["segment"] + 1 if checkpoint else 0,
+            )
 
-    # Connect to eyetracker and calibrate it
+    # Calibrating shows the first screen, so this is where start-up ends
+    profile.mark("first screen")
+    if args.profile_startup:
+        profile.report()
+        if not testing:
+            eyelinker.tracker.close_edf()
+            eyelinker.tracker.close_connection()
+        core.quit()
+        return
+
+    # Calibrate eyetracker
     if not testing:
-        eyelinker = Eyelinker(
-            new_participants.participant_number.iloc[-1],
-            new_participants.session_number.iloc[-1],
-            settings["window"],
-            settings["directory"],
-        )
         eyelinker.calibrate()
 
-    # Start recording eyetracker
-    if not testing:
-        eyelinker.start()
+    schedule_path = os.path.join(
+        settings["directory"],
+        f"schedule_session_{session_number}{'_test' if testing else ''}.npy",
+    )
+    data_path = os.path.join(
+        settings["directory"],
+        f"data_session_{session_number}{'_test' if testing else ''}.csv",
+    )
+    key_log_path = os.path.join(
+        settings["directory"],
+        f"keys_session_{session_number}{'_test' if testing else ''}.bin",
+    )
+    checkpoint_path = get_checkpoint_path(
+        settings["directory"], session_number, testing
+    )
+
+    if checkpoint:
+        # Use the schedule of the interrupted session, and drop the trial that was
+        # running when it was interrupted
+        schedule = load_schedule(schedule_path)
+        truncate_trial_file(data_path, checkpoint["data_size"])
+        truncate_trial_file(key_log_path, checkpoint["key_log_size"])
 
-    # Practice until participant wants to stop
-    practice(testing, colour_assignment, settings)
+    else:
+        # Start recording eyetracker
+        if not testing:
+            eyelinker.start()
+
+        # Generate pseudo-random order of all blocks and trials up front
+        schedule = compile_schedule(
+            2 if testing else N_BLOCKS,
+            12 if testing else TRIALS_PER_BLOCK,
+            get_schedule_seed(
+                participant["participant_number"],
+                session_number,
+            ),
+        )
+        save_schedule(schedule, schedule_path)
+
+        # Practice until participant wants to stop
+        practice(testing, colour_assignment, settings)
+
+        # The practice is saved in its own .edf file
+        if not testing:
+            eyelinker.end_segment()
 
     # Initialise some stuff
-    start_of_experiment = time()
-    data = []
-    current_trial = 0
+    writer = TrialWriter(data_path)
+    key_writer = KeyLogWriter(key_log_path)
+    if checkpoint:
+        start_of_experiment = time() - checkpoint["elapsed_time"]
+        current_trial = checkpoint["current_trial"]
+        set_random_state(checkpoint["random_state"])
+        if observer:
+            # Practice is skipped, so the observer shouldn't stop trials early
+            set_random_state(checkpoint["observer_state"]["random"], observer.random)
+            observer.practice_parts_left = checkpoint["observer_state"][
+                "practice_parts_left"
+            ]
+            observer.trials_in_part = checkpoint["observer_state"]["trials_in_part"]
+    else:
+        start_of_experiment = time()
+        current_trial = 0
+    trials_before_resuming = current_trial
     finished_early = True
 
     # Start experiment
     try:
-        # Generate pseudo-random order of blocks
-        blocks = create_blocks(2 if testing else N_BLOCKS)
-
-        for block_nr, block_type in blocks:
-            # Create temporary variable for saving block performance
-            block_hit = []
-            block_false_alarm = []
-            block_target_present = []
-
-            # Pseudo-randomly create conditions and target locations (so they're weighted)
-            block_info = create_block(12 if testing else TRIALS_PER_BLOCK)
+        for block_nr, block_type in get_blocks(schedule):
+            # Keep track of performance during this block
+            block_stats = PerformanceStats()
+
+            # Look up pseudo-randomly created conditions and target locations
+            block_info = get_block(schedule, block_nr)
+
+            # Skip everything that was done before the session was resumed, and
+            # continue the interrupted block with its scores so far
+            if checkpoint and block_nr < checkpoint["block"]:
+                continue
+            if checkpoint and block_nr == checkpoint["block"]:
+                block_stats = PerformanceStats.from_dict(checkpoint["block_stats"])
+                block_info = block_info[block_stats.n_trials :]
+                if len(block_info) == 0:
+                    continue
 
             # Remind participant of block type
             calibrated = True
@@ -115,25 +287,36 @@ def main():
                     eyetracker=None if testing else eyelinker,
                 )
 
+            # Record every block in its own .edf file
+            if not testing:
+                eyelinker.start()
+
+            # Look up everything that is the same for every trial of this block once
+            plan = TrialPlan(settings["timelines"]["trial"], block_type, settings)
+
             # Clear keyboard cache before starting again
-            settings["keyboard"].clearEvents()
+            settings["keyboard"].clear()
 
             # Run trials per pseudo-randomly created info
-            for cue_colour, condition, target_bar in block_info:
+            for trial_info in block_info:
                 current_trial += 1
                 start_time = time()
 
-                # Determine response trial or not
-                response_required = determine_response_required(block_type, cue_colour)
+                stimuli_characteristics: dict = stimuli_characteristics_from_schedule(
+                    trial_info, settings
+                )
 
-                stimuli_characteristics: dict = generate_stimuli_characteristics(
-                    cue_colour, condition, target_bar, settings
+                # Determine response trial or not
+                response_required = determine_response_required(
+                    block_type, stimuli_characteristics["capture_colour_id"]
                 )
 
                 # Generate trial
+                if not testing:
+                    eyelinker.send_trial_id(current_trial)
                 report: dict = single_trial(
                     **stimuli_characteristics,
-                    response_type=block_type,
+                    plan=plan,
                     response_required=response_required,
                     settings=settings,
                     testing=testing,
@@ -141,8 +324,8 @@ def main():
                 )
                 end_time = time()
 
-                # Save trial data
-                data.append(
+                # Save trial data straight away, before the next trial starts
+                writer.write(
                     {
                         "trial_number": current_trial,
                         "block_type": block_type,
@@ -153,19 +336,54 @@ def main():
                         "end_time": str(
                             dt.timedelta(seconds=(end_time - start_of_experiment))
                         ),
+                        "previous_write_time_in_ms": writer.last_write_time_in_ms,
                         **stimuli_characteristics,
                         **report,
                     }
                 )
-                block_hit.append(report["cue_hit"])
-                block_false_alarm.append(report["cue_false_alarm"])
-                block_target_present.append(response_required)
-
-            # Calculate average performance score for most recent block
-            hits = round(mean(block_hit) / mean(block_target_present) * 100)
-            false_alarms = round(
-                mean(block_false_alarm) / (1 - mean(block_target_present)) * 100
-            )
+                key_writer.write(
+                    get_key_event_array(
+                        settings["keyboard"].take_log(),
+                        current_trial,
+                        settings["flip_log"].onset("probe"),
+                        settings["flip_log"].onset("capture_cue"),
+                    )
+                )
+                block_stats.add(report, response_required)
+
+                # Remember where the session is, so it can be resumed from here,
+                # only once everything it points to is on disk
+                writer.sync()
+                key_writer.sync()
+                save_checkpoint(
+                    checkpoint_path,
+                    {
+                        "participant_number": participant["participant_number"],
+                        "colour_assignment": colour_assignment,
+                        "colours": settings["colours"],
+                        "block": block_nr,
+                        "current_trial": current_trial,
+                        "elapsed_time": end_time - start_of_experiment,
+                        "block_stats": block_stats.to_dict(),
+                        "data_size": writer.size,
+                        "key_log_size": key_writer.size,
+                        "segment": 0 if testing else eyelinker.segment,
+                        "random_state": get_random_state(),
+                        "observer_state": (
+                            {
+                                "random": get_random_state(observer.random),
+                                "practice_parts_left": observer.practice_parts_left,
+                                "trials_in_part": observer.trials_in_part,
+                            }
+                            if observer
+                            else None
+                        ),
+                    },
+                )
+
+            # Transfer this block's .edf file during the break
+            if not testing:
+                eyelinker.end_segment()
 
             # Break after end of block, unless it's the last block.
             # Experimenter can re-calibrate the eyetracker by pressing 'c' here.
@@ -174,20 +392,16 @@ def main():
                 while calibrated:
                     calibrated = long_break(
                         N_BLOCKS,
-                        hits,
-                        false_alarms,
+                        block_stats,
                         settings,
                         eyetracker=None if testing else eyelinker,
                     )
-                if not testing:
-                    eyelinker.start()
             elif block_nr < N_BLOCKS:
                 while calibrated:
                     calibrated = block_break(
                         block_nr,
                         N_BLOCKS,
-                        hits,
-                        false_alarms,
+                        block_stats,
                         settings,
                         eyetracker=None if testing else eyelinker,
                     )
@@ -203,21 +417,15 @@ def main():
         if not testing:
             eyelinker.stop()
 
-        # Save all collected trial data to a new .csv
-        pd.DataFrame(data).to_csv(
-            rf"{settings['directory']}\data_session_{new_participants.session_number.iloc[-1]}{'_test' if testing else ''}.csv",
-            index=False,
-        )
+        # Make sure all trial data is saved
+        writer.close()
+        key_writer.close()
 
         # Register how many trials this participant has completed
-        new_participants.loc[new_participants.index[-1], "trials_completed"] = str(
-            len(data)
-        )
-
-        # Save participant data to existing .csv file
-        new_participants.to_csv(
-            rf"{settings['directory']}\participantinfo.csv", index=False
-        )
+        if registry:
+            registry.finish_session(
+                session_number, trials_before_resuming + writer.n_written
+            )
 
         # Done!
         if finished_early:
@@ -3,53 +3,284 @@ This file contains the functions necessary for
 collecting participant data.
 To run the 'action coupled null-cue' experiment, see main.py.
 
+All participants are kept in participants.sqlite, which is safe to share between
+lab computers on the same data drive. participantinfo.csv is exported from it
+after every change, and imported from once when there is no registry yet.
+
 made by Anna van Harmelen, 2025
 """
 
+from contextlib import contextmanager
+import csv
+import os
 import random
-import pandas as pd
+import socket
+import sqlite3
+import time
+import uuid
+
+COLUMNS = [
+    "participant_number",
+    "session_number",
+    "age",
+    "trials_completed",
+    "colour_assignment",
+]
+COLOUR_OPTIONS = ["orange", "green", "blue"]
+PARTICIPANT_NUMBERS = range(10, 100)
+
+# A lock that doesn't change for this long is left behind by a computer that crashed
+STALE_LOCK_AGE = 60  # in seconds
+
+
+class ParticipantRegistry:
+    """
+    Hands out participant and session numbers, never the same one twice, even
+    when several computers register participants at the same time.
+    The participant numbers are shuffled once, when the registry is created,
+    so every new participant simply gets the next unused one.
+
+    usage:
+
+       registry = ParticipantRegistry(directory)
+       participant = registry.register(age)
+       registry.finish_session(participant["session_number"], trials_completed)
+    """
+
+    def __init__(self, directory, participant_numbers=PARTICIPANT_NUMBERS) -> None:
+        self.directory = directory
+        self.path = os.path.join(directory, "participants.sqlite")
+        self.csv_path = os.path.join(directory, "participantinfo.csv")
+        self.lock_path = os.path.join(directory, "participants.lock")
+
+        with self.lock():
+            with self.connect() as connection:
+                self.create(connection, participant_numbers)
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return _Transaction(connection)
+
+    @contextmanager
+    def lock(self, timeout=2 * STALE_LOCK_AGE):
+        """
+        Only one computer at a time gets to change the registry. SQLite's own
+        locking can't be trusted on network drives, so this uses a lock file,
+        with a token that is unique to every lock.
+        Only this computer's own clock is used to tell whether a lock is stale, the
+        clocks of the computers sharing the drive don't have to agree.
+        """
+        token = f"{socket.gethostname()} {os.getpid()} {uuid.uuid4().hex}"
+        start = time.monotonic()
+        holder, held_since = None, None
+
+        while True:
+            try:
+                file = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                current = self.read_lock()
+                if current is None:
+                    continue
+                if current != holder:
+                    holder, held_since = current, time.monotonic()
+                elif time.monotonic() - held_since > STALE_LOCK_AGE:
+                    self.remove_lock(holder)
+                    continue
 
+                if time.monotonic() - start > timeout:
+                    raise Exception(
+                        f"The participant registry is locked, remove {self.lock_path} "
+                        "if no other computer is registering a participant."
+                    )
+                time.sleep(0.1)
+
+        try:
+            os.write(file, token.encode())
+            os.close(file)
+            yield
+        finally:
+            self.remove_lock(token)
+
+    def read_lock(self):
+        # The token of whoever holds the lock, or None if nobody does
+        try:
+            with open(self.lock_path) as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def remove_lock(self, token):
+        # Never remove a lock that another computer took in the meantime
+        if self.read_lock() == token:
+            try:
+                os.remove(self.lock_path)
+            except FileNotFoundError:
+                pass
+
+    def create(self, connection, participant_numbers):
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS participants ("
+            "session_number INTEGER PRIMARY KEY, "
+            "participant_number INTEGER NOT NULL, "
+            "age INTEGER NOT NULL, "
+            "trials_completed TEXT, "
+            "colour_assignment TEXT NOT NULL)"
+        )
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS participant_numbers ("
+            "position INTEGER PRIMARY KEY, "
+            "participant_number INTEGER UNIQUE NOT NULL)"
+        )
+
+        if connection.execute("SELECT 1 FROM participant_numbers LIMIT 1").fetchone():
+            return
+
+        if connection.execute("SELECT 1 FROM participants LIMIT 1").fetchone() is None:
+            self.import_csv(connection)
+
+        used = {
+            row["participant_number"]
+            for row in connection.execute("SELECT participant_number FROM participants")
+        }
+        unused = [number for number in participant_numbers if number not in used]
+        random.shuffle(unused)
+
+        connection.executemany(
+            "INSERT INTO participant_numbers VALUES (?, ?)", enumerate(unused)
+        )
 
-def get_participant_details(existing_participants: pd.DataFrame, testing):
-    # Generate random & unique participant number
-    participant = random.randint(10, 99)
-    while participant in existing_participants.participant_number.tolist():
-        participant = random.randint(10, 99)
+    def import_csv(self, connection):
+        if not os.path.exists(self.csv_path):
+            return
 
-    print(f"Participant number: {participant}")
+        with open(self.csv_path, newline="") as file:
+            connection.executemany(
+                "INSERT INTO participants VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        int(row["session_number"]),
+                        int(row["participant_number"]),
+                        int(row["age"]),
+                        row["trials_completed"],
+                        row["colour_assignment"],
+                    )
+                    for row in csv.DictReader(file)
+                ],
+            )
 
+    def register(self, age):
+        """
+        Allocate a new participant and session number, and the next colour assignment.
+        """
+        with self.lock():
+            with self.connect() as connection:
+                unused = connection.execute(
+                    "SELECT position, participant_number FROM participant_numbers "
+                    "ORDER BY position LIMIT 1"
+                ).fetchone()
+                if unused is None:
+                    raise Exception("All participant numbers have been used.")
+
+                connection.execute(
+                    "DELETE FROM participant_numbers WHERE position = ?",
+                    (unused["position"],),
+                )
+
+                last = connection.execute(
+                    "SELECT session_number, colour_assignment FROM participants "
+                    "ORDER BY session_number DESC LIMIT 1"
+                ).fetchone()
+
+                participant = {
+                    "participant_number": unused["participant_number"],
+                    "session_number": last["session_number"] + 1 if last else 1,
+                    "age": age,
+                    "trials_completed": None,
+                    "colour_assignment": get_next_colour(
+                        last["colour_assignment"] if last else "0"
+                    ),
+                }
+                connection.execute(
+                    "INSERT INTO participants VALUES "
+                    "(:session_number, :participant_number, :age, :trials_completed, "
+                    ":colour_assignment)",
+                    participant,
+                )
+
+            self.export_csv()
+
+        return participant
+
+    def finish_session(self, session_number, trials_completed):
+        with self.lock():
+            with self.connect() as connection:
+                connection.execute(
+                    "UPDATE participants SET trials_completed = ? "
+                    "WHERE session_number = ?",
+                    (str(trials_completed), session_number),
+                )
+
+            self.export_csv()
+
+    def export_csv(self):
+        """
+        Write all participants to participantinfo.csv, in the same format as before.
+        """
+        with self.connect() as connection:
+            rows = connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM participants ORDER BY session_number"
+            ).fetchall()
+
+        # Replace the file in one go, so it's never half written
+        temporary_path = f"{self.csv_path}.{socket.gethostname()}.tmp"
+        with open(temporary_path, "w", newline="") as file:
+            writer = csv.writer(file, lineterminator="\n")
+            writer.writerow(COLUMNS)
+            writer.writerows(
+                ["" if value is None else value for value in row] for row in rows
+            )
+        os.replace(temporary_path, self.csv_path)
+
+
+class _Transaction:
+    """
+    Runs everything in one write transaction, and closes the connection after.
+    """
+
+    def __init__(self, connection) -> None:
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exception_type, exception, traceback):
+        try:
+            self.connection.execute("ROLLBACK" if exception_type else "COMMIT")
+        finally:
+            self.connection.close()
+
+
+def get_next_colour(previous_colour):
+    # Colours are assigned in turn, starting with the first
+    if previous_colour not in COLOUR_OPTIONS:
+        return COLOUR_OPTIONS[0]
+
+    return COLOUR_OPTIONS[
+        (COLOUR_OPTIONS.index(previous_colour) + 1) % len(COLOUR_OPTIONS)
+    ]
+
+
+def get_participant_details(registry: ParticipantRegistry, testing):
     if not testing:
         # Get participant age
         age = int(input("Participant age: "))
     else:
         age = 00
 
-    # Insert session number
-    session = max(existing_participants.session_number) + 1
-
-    # Determine colour assignment
-    options = ["orange", "green", "blue"]
-    if existing_participants.colour_assignment.tolist()[-1] != "0":
-        colour_index = (
-            options.index(existing_participants.colour_assignment.tolist()[-1]) + 1
-        )
-        if colour_index == 3:
-            colour_index = 0
-        colour_assignment = options[colour_index]
-    else:
-        colour_assignment = options[0]
-
-    # Add newly made participant
-    new_participant = pd.DataFrame(
-        {
-            "age": [age],
-            "participant_number": [participant],
-            "session_number": [session],
-            "colour_assignment": [colour_assignment],
-        }
-    )
-    all_participants = pd.concat(
-        [existing_participants, new_participant], ignore_index=True
-    )
+    participant = registry.register(age)
+    print(f"Participant number: {participant['participant_number']}")
 
-    return all_participants, colour_assignment
+    return participant, participant["colour_assignment"]
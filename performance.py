@@ -0,0 +1,208 @@
+"""
+This file contains the functions necessary for
+keeping track of performance while a block or practice is running.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+from bisect import insort
+from statistics import NormalDist
+
+# Quantiles of the reaction time and dial error that are kept up to date
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+class PerformanceStats:
+    """
+    Updates all scores after every trial, in the same time no matter how many
+    trials came before, so they can be shown at any moment without going over
+    all trials again.
+
+    usage:
+
+       stats = PerformanceStats()
+       stats.add(report, response_required)  # after every trial
+       stats.hit_score, stats.false_alarm_score  # in %
+       stats.d_prime
+       stats.reaction_time[QUANTILES.index(0.5)].value  # median, in ms
+    """
+
+    def __init__(self) -> None:
+        self.n_trials = 0
+        self.n_target_present = 0
+        self.n_hits = 0
+        self.n_false_alarms = 0
+        self.n_premature = 0
+        self.dropped_frames = 0
+        self.trials_with_dropped_frames = 0
+        self.reaction_time = [StreamingQuantile(p) for p in QUANTILES]
+        self.dial_error = [StreamingQuantile(p) for p in QUANTILES]
+
+    def add(self, report: dict, response_required):
+        self.n_trials += 1
+        self.n_target_present += bool(response_required)
+        self.n_hits += bool(report["cue_hit"])
+        self.n_false_alarms += bool(report["cue_false_alarm"])
+        self.n_premature += bool(report["premature_pressed"])
+        self.dropped_frames += report["dropped_frames"]
+        self.trials_with_dropped_frames += bool(report["dropped_frames"])
+
+        for quantile in self.reaction_time:
+            quantile.add(report["idle_reaction_time_in_ms"])
+        for quantile in self.dial_error:
+            quantile.add(report["absolute_difference"])
+
+    @property
+    def n_target_absent(self):
+        return self.n_trials - self.n_target_present
+
+    @property
+    def hit_rate(self):
+        if not self.n_target_present:
+            return None
+        return self.n_hits / self.n_target_present
+
+    @property
+    def false_alarm_rate(self):
+        if not self.n_target_absent:
+            return None
+        return self.n_false_alarms / self.n_target_absent
+
+    @property
+    def hit_score(self):
+        # In %, 0 if there were no trials to respond to yet
+        return round(self.hit_rate * 100) if self.hit_rate is not None else 0
+
+    @property
+    def false_alarm_score(self):
+        # In %, 0 if there were no trials to withhold a response in yet
+        if self.false_alarm_rate is None:
+            return 0
+        return round(self.false_alarm_rate * 100)
+
+    @property
+    def d_prime(self):
+        """
+        With the log-linear correction (Hautus, 1995), so hit and false alarm rates
+        of 0 or 1 don't give an infinite d'.
+        """
+        if not self.n_trials:
+            return None
+
+        hit_rate = (self.n_hits + 0.5) / (self.n_target_present + 1)
+        false_alarm_rate = (self.n_false_alarms + 0.5) / (self.n_target_absent + 1)
+
+        return NormalDist().inv_cdf(hit_rate) - NormalDist().inv_cdf(false_alarm_rate)
+
+    @property
+    def premature_rate(self):
+        if not self.n_trials:
+            return None
+        return self.n_premature / self.n_trials
+
+    def to_dict(self):
+        # Everything is a number or a list, so this can be saved as json
+        return {
+            **vars(self),
+            "reaction_time": [vars(quantile) for quantile in self.reaction_time],
+            "dial_error": [vars(quantile) for quantile in self.dial_error],
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        stats = cls()
+        vars(stats).update(state)
+        stats.reaction_time = [
+            StreamingQuantile.from_dict(quantile) for quantile in state["reaction_time"]
+        ]
+        stats.dial_error = [
+            StreamingQuantile.from_dict(quantile) for quantile in state["dial_error"]
+        ]
+        return stats
+
+
+class StreamingQuantile:
+    """
+    Estimates one quantile of all values added so far, using five markers instead
+    of keeping the values (the P² algorithm, Jain & Chlamtac, 1985).
+    Exact while there are five values or less.
+    """
+
+    def __init__(self, p) -> None:
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired_positions = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    @property
+    def value(self):
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            return self.heights[round(self.p * (self.count - 1))]
+        return self.heights[2]
+
+    def add(self, x):
+        self.count += 1
+
+        # The first five values are the markers
+        if self.count <= 5:
+            insort(self.heights, x)
+            return
+
+        heights, positions = self.heights, self.positions
+
+        # Find the cell x falls in, stretching the outer markers if needed
+        if x < heights[0]:
+            heights[0] = x
+            cell = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            cell = 3
+        else:
+            cell = next(i for i in range(4) if heights[i] <= x < heights[i + 1])
+
+        for i in range(cell + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired_positions[i] += self.increments[i]
+
+        # Move the middle markers towards where they should be
+        for i in (1, 2, 3):
+            offset = self.desired_positions[i] - positions[i]
+
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or (
+                offset <= -1 and positions[i - 1] - positions[i] < -1
+            ):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, step)
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i, step):
+        heights, positions = self.heights, self.positions
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step)
+            * (heights[i + 1] - heights[i])
+            / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - step)
+            * (heights[i] - heights[i - 1])
+            / (positions[i] - positions[i - 1])
+        )
+
+    def _linear(self, i, step):
+        heights, positions = self.heights, self.positions
+        return heights[i] + step * (heights[i + step] - heights[i]) / (
+            positions[i + step] - positions[i]
+        )
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        quantile = cls(state["p"])
+        vars(quantile).update(state)
+        return quantile
@@ -8,17 +8,16 @@ made by Anna van Harmelen, 2025
 
 from trial import (
     single_trial,
+    respond_to_probe,
     generate_stimuli_characteristics,
     determine_response_required,
 )
-from stimuli import make_one_bar, create_fixation_dot, show_text
-from response import get_response, wait_for_key
-from block import show_block_type
-from psychopy import event
-from psychopy.hardware.keyboard import Keyboard
-from time import sleep
+from timeline import TrialPlan
+from stimuli import make_one_bar, show_text
+from response import wait_for_key
+from block import show_block_type, get_performance_summary
 import random
-from numpy import mean
+from performance import PerformanceStats
 
 # 1. Practice response dial with a visible bar
 # 2. Practice full trials - block type 1
@@ -49,6 +48,7 @@ def practice_dial(testing, settings):
     wait_for_key(["space"], settings["keyboard"])
 
     # Practice dial until user chooses to stop
+    plan = TrialPlan(settings["timelines"]["practice_dial"], None, settings)
     try:
         while True:
             target_bar = "left"
@@ -56,35 +56,24 @@ def practice_dial(testing, settings):
                 3, "neutral", target_bar, settings
             )
             target_orientation = target["target_orientation"]
-            target_colour = None
 
             practice_bar = make_one_bar(
                 target_orientation, "#eaeaea", "middle", settings
             )
 
-            report: dict = get_response(
-                target_orientation,
-                target_colour,
-                False,
-                settings,
-                testing,
-                None,
-                1,
-                target_bar,
-                None,
-                None,
-                [practice_bar],
+            plan.run(
+                {
+                    "target_orientation": target_orientation,
+                    "target_colour": None,
+                    "response_required": False,
+                    "trial_condition": 1,
+                    "target_bar": target_bar,
+                    "capture_colour_id": None,
+                    "additional_objects": [practice_bar],
+                },
+                respond_to_probe,
             )
 
-            create_fixation_dot(settings, "practice")
-            show_text(
-                f"{report['performance']}",
-                settings["window"],
-                (0, settings["deg2pix"](0.5)),
-            )
-            settings["window"].flip()
-            sleep(0.5)
-
     except KeyboardInterrupt:
         show_text(
             "You decided to stop practising the response dial."
@@ -97,13 +86,12 @@ def practice_dial(testing, settings):
 
 def practice_indefinitely(block_type, colour_assignment, first_block, settings):
     try:
-        # Create empty performance list
-        hit = []
-        false_alarm = []
-        target_present = []
+        # Keep track of performance while practising
+        stats = PerformanceStats()
 
         # Show block type
         show_block_type(block_type, colour_assignment, settings, None)
+        plan = TrialPlan(settings["timelines"]["trial"], block_type, settings)
 
         while True:
             cue_colour = random.choice([1, 2, 3])
@@ -117,27 +105,24 @@ def practice_indefinitely(block_type, colour_assignment, first_block, settings):
                 cue_colour, condition, target_bar, settings
             )
 
+            response_required = determine_response_required(block_type, cue_colour)
+
             report: dict = single_trial(
                 **stimulus,
-                response_type=block_type,
-                response_required=determine_response_required(block_type, cue_colour),
+                plan=plan,
+                response_required=response_required,
                 settings=settings,
                 testing=True,
             )
 
-            hit.append(report["cue_hit"])
-            false_alarm.append(report["cue_false_alarm"])
-            target_present.append(determine_response_required(block_type, cue_colour))
+            stats.add(report, response_required)
 
     except KeyboardInterrupt:
-        hit_score = round(mean(hit) / mean(target_present) * 100) if len(hit) > 1 else 0
-        false_alarm_score = round(mean(false_alarm) / (1 - mean(target_present)) * 100) if len(false_alarm) > 1 else 0
-
         if first_block:
             show_text(
                 "You decided to stop practising the first block type."
                 f"\nDuring this practice, your score was:\n"
-                f"Hit: {hit_score}% \t False alarm: {false_alarm_score}%\n"
+                f"{get_performance_summary(stats)}\n"
                 "\n\nPress SPACE to start practicing the other block type. ",
                 settings["window"],
             )
@@ -148,7 +133,7 @@ def practice_indefinitely(block_type, colour_assignment, first_block, settings):
             show_text(
                 "You decided to stop practicing the second block type."
                 f"\nDuring this practice, your score was:\n"
-                f"Hit: {hit_score}% \t False alarm: {false_alarm_score}%\n"
+                f"{get_performance_summary(stats)}\n"
                 "\n\nPress SPACE to start the experiment.",
                 settings["window"],
             )
@@ -6,23 +6,26 @@ To run the 'action coupled null-cue' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-from psychopy import core, visual, event
-from psychopy.hardware.keyboard import Keyboard
-from math import cos, sin, degrees
-from stimuli import create_fixation_dot, make_circle, RESPONSE_DIAL_SIZE
-from time import time
-from eyetracker import get_trigger
-
-
-def turn_handle(pos, dial_step_size):
-    x, y = pos
-    pos = (
-        x * cos(dial_step_size) + y * sin(dial_step_size),
-        -x * sin(dial_step_size) + y * cos(dial_step_size),
-    )
+from math import degrees
+from stimuli import create_fixation_dot
+from inputs import InputEngine
+import numpy as np
+
+
+def make_dial_trajectory(settings):
+    """
+    Precompute the positions of both dial handles after every step the dial can
+    make in one response, for both directions. Index as [key, turns, handle]:
+    key 0 is 'm' (clockwise), key 1 is 'z', handle 0 is the top handle.
+    """
+    radius = settings["geometry"].dial_radius
+    angles = np.arange(settings["monitor"]["Hz"] + 1) * settings["dial_step_size"]
+    angles = np.stack([angles, -angles])
+
+    top_handle = np.stack([radius * np.sin(angles), radius * np.cos(angles)], axis=-1)
 
-    # centre, distance, rad
-    return pos
+    # The bottom handle is always opposite the top handle
+    return np.stack([top_handle, -top_handle], axis=2)
 
 
 def get_report_orientation(key, turns, dial_step_size):
@@ -83,23 +86,32 @@ def evaluate_response(report_orientation, target_orientation, key):
 
 
 def make_dial(settings, colour=None):
-    dial_circle = make_circle(RESPONSE_DIAL_SIZE, settings, colour=colour)
-    top_dial = make_circle(
-        RESPONSE_DIAL_SIZE / 15,
-        settings,
-        pos=(0, RESPONSE_DIAL_SIZE),
-        handle=True,
-    )
-    bottom_dial = make_circle(
-        RESPONSE_DIAL_SIZE / 15,
-        settings,
-        pos=(0, -RESPONSE_DIAL_SIZE),
-        handle=True,
-    )
+    stimuli = settings["stimuli"]
+
+    # Re-use the dial stimuli, reset to their starting position
+    dial_circle = stimuli.dial_circle
+    dial_circle.lineColor = colour if colour else "#d4d4d4"
+
+    top_dial, bottom_dial = stimuli.top_handle, stimuli.bottom_handle
+    top_dial.pos, bottom_dial.pos = stimuli.handle_positions
 
     return dial_circle, top_dial, bottom_dial
 
 
+def draw_dial_frame(dial, handle_positions, additional_objects, block_type, settings):
+    dial_circle, top_dial, bottom_dial = dial
+    top_dial.pos, bottom_dial.pos = handle_positions
+
+    for item in additional_objects:
+        item.draw()
+
+    dial_circle.draw()
+    top_dial.draw()
+    bottom_dial.draw()
+    if not additional_objects:
+        create_fixation_dot(settings, block_type)
+
+
 def get_response(
     target_orientation,
     target_colour,
@@ -110,21 +122,26 @@ def get_response(
     trial_condition,
     target_bar,
     block_type,
-    capture_colour,
+    capture_colour_id,
     additional_objects=[],
 ):
-    keyboard: Keyboard = settings["keyboard"]
+    keyboard: InputEngine = settings["keyboard"]
     window = settings["window"]
 
     # Check for pressed 'q'
-    check_quit(keyboard)
+    keyboard.check_quit()
+
+    # Let a simulated observer know what it is responding to
+    keyboard.backend.observe(target_orientation, response_required)
 
-    # These timing systems should start at the same time, this is almost true
-    idle_reaction_time_start = time()
-    keyboard.clock.reset()  # this reset ensures that premature key timings are relative to probe onset
+    # Key events are on the same clock as the flips, so all timings are relative
+    # to the flip that showed the probe
+    probe_onset = settings["flip_log"].last_flip_time
 
     # Check if _any_ keys were prematurely pressed
-    prematurely_pressed = [(p.name, p.rt) for p in keyboard.getKeys()]
+    prematurely_pressed = [
+        (press.name, press.time - probe_onset) for press in keyboard.presses()
+    ]
 
     # Evaluate response to capture cue
     cue_response_hit, cue_response_false_alarm = evaluate_cue_response(
@@ -132,28 +149,21 @@ def get_response(
     )
 
     # Now clear keyboard before next response
-    keyboard.clearEvents()
+    keyboard.clear()
 
     turns = 0
 
-    for item in additional_objects:
-        item.draw()
-        window.flip()
-
     # Wait indefinitely until the participant starts giving an answer
-    keyboard.clearEvents()  # do it again to be sure
-    pressed = event.waitKeys(keyList=["z", "m", "q"])
-
-    response_started = time()
-    idle_reaction_time = response_started - idle_reaction_time_start
+    press = keyboard.wait_for_press(["z", "m", "q"])
+    idle_reaction_time = press.time - probe_onset
 
-    if "m" in pressed:
+    if press.name == "m":
         key = "m"
-        rad = settings["dial_step_size"]
-    elif "z" in pressed:
+        handle_positions = settings["dial_trajectory"][0]
+    elif press.name == "z":
         key = "z"
-        rad = -settings["dial_step_size"]
-    if "q" in pressed:
+        handle_positions = settings["dial_trajectory"][1]
+    if press.name == "q":
         raise KeyboardInterrupt()
 
     # Stop rotating the moment either of the following happens:
@@ -163,34 +173,38 @@ def get_response(
     dial_circle, top_dial, bottom_dial = make_dial(settings, target_colour)
 
     if not testing and eyetracker:
-        trigger = get_trigger(
-            block_type,
-            "response_onset",
-            capture_colour,
-            trial_condition,
-            target_bar,
-            settings,
+        trigger = settings["triggers"].encode(
+            block_type, "response_onset", capture_colour_id, trial_condition, target_bar
         )
-        eyetracker.tracker.send_message(f"trig{trigger}")
-
-    while not keyboard.getKeys(keyList=[key]) and turns < settings["monitor"]["Hz"]:
-        top_dial.pos = turn_handle(top_dial.pos, rad)
-        bottom_dial.pos = turn_handle(bottom_dial.pos, rad)
 
+    while (
+        not keyboard.released(key, since=press.time)
+        and turns < settings["monitor"]["Hz"]
+    ):
         turns += 1
 
-        for item in additional_objects:
-            item.draw()
+        draw_dial_frame(
+            (dial_circle, top_dial, bottom_dial),
+            handle_positions[turns],
+            additional_objects,
+            block_type,
+            settings,
+        )
+
+        flip_time = settings["flip_log"].flip(window, "dial")
 
-        dial_circle.draw()
-        top_dial.draw()
-        bottom_dial.draw()
-        if not additional_objects:
-            create_fixation_dot(settings, block_type)
+        # Send trigger at the first flip of the moving dial
+        if turns == 1 and not testing and eyetracker:
+            eyetracker.send_trigger(trigger, flip_time)
 
-        window.flip()
+    # The key could have been released before the dial moved at all
+    if turns == 0 and not testing and eyetracker:
+        eyetracker.send_trigger(trigger)
 
-    response_time = time() - response_started
+    # Until the key was released, or the dial stopped by itself
+    release = keyboard.released(key, since=press.time)
+    response_end = release.time if release else settings["flip_log"].last_flip_time
+    response_time = response_end - press.time
 
     return {
         "idle_reaction_time_in_ms": round(idle_reaction_time * 1000, 2),
@@ -216,14 +230,8 @@ def get_response(
     }
 
 
-def wait_for_key(key_list, keyboard):
-    keyboard: Keyboard = keyboard
-    keyboard.clearEvents()
-    keys = event.waitKeys(keyList=key_list)
+def wait_for_key(key_list, keyboard: InputEngine):
+    keyboard.clear()
+    press = keyboard.wait_for_press(key_list)
 
-    return keys
-
-
-def check_quit(keyboard):
-    if keyboard.getKeys("q"):
-        raise KeyboardInterrupt()
+    return [press.name]
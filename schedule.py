@@ -0,0 +1,105 @@
+"""
+This file contains the functions necessary for
+generating the order of all blocks and trials of a session before it starts.
+The schedule only depends on the seed, so any session can be regenerated offline.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import numpy as np
+
+BLOCK_TYPES = ["respond 3", "respond not 3"]
+CONDITIONS = ["congruent", "incongruent", "neutral"]
+TARGET_BARS = ["left", "right"]
+
+TRIAL_DTYPE = np.dtype(
+    [
+        ("block", np.uint8),
+        ("block_type", np.uint8),  # index into BLOCK_TYPES
+        ("cue_colour", np.uint8),  # 1, 2 or 3
+        ("condition", np.uint8),  # index into CONDITIONS
+        ("target_bar", np.uint8),  # index into TARGET_BARS
+        ("left_orientation", np.int8),
+        ("right_orientation", np.int8),
+        ("neutral_swap", np.bool_),  # swap colours 1 & 2 in neutral trials
+        ("ITI_in_ms", np.uint16),
+    ]
+)
+
+
+def get_schedule_seed(participant, session):
+    # Unique for every combination, however large the participant numbers get
+    return np.random.SeedSequence([int(session), int(participant)])
+
+
+def compile_schedule(n_blocks, trials_per_block, seed):
+    if n_blocks % 2 != 0:
+        raise Exception("Expected number of blocks to be divisible by 2.")
+    if trials_per_block % 12 != 0:
+        raise Exception("Expected number of trials to be divisible by 12.")
+
+    rng = np.random.default_rng(seed)
+    n_trials = n_blocks * trials_per_block
+
+    # Generate an equal number of blocks of all types, in pseudo-random order
+    block_types = rng.permutation(np.tile(np.arange(len(BLOCK_TYPES)), n_blocks // 2))
+
+    # Generate equal distribution of cue colours, congruencies and target locations
+    # within a block
+    cue_colours = np.repeat([1, 2, 3], trials_per_block // 3)
+    conditions = np.concatenate(
+        [
+            np.tile([0, 0, 1, 1], trials_per_block // 6),
+            np.full(trials_per_block // 3, 2),
+        ]
+    )
+    target_bars = np.tile([0, 1], trials_per_block // 2)
+
+    # Shuffle trials within every block
+    order = rng.permuted(
+        np.tile(np.arange(trials_per_block), (n_blocks, 1)), axis=1
+    ).ravel()
+
+    schedule = np.zeros(n_trials, dtype=TRIAL_DTYPE)
+    schedule["block"] = np.repeat(np.arange(1, n_blocks + 1), trials_per_block)
+    schedule["block_type"] = np.repeat(block_types, trials_per_block)
+    schedule["cue_colour"] = cue_colours[order]
+    schedule["condition"] = conditions[order]
+    schedule["target_bar"] = target_bars[order]
+
+    # Sample all trial characteristics at once
+    schedule["left_orientation"] = rng.choice([-1, 1], n_trials) * rng.integers(
+        5, 86, n_trials
+    )
+    schedule["right_orientation"] = rng.choice([-1, 1], n_trials) * rng.integers(
+        5, 86, n_trials
+    )
+    schedule["neutral_swap"] = rng.integers(0, 2, n_trials).astype(bool)
+    schedule["ITI_in_ms"] = rng.integers(500, 801, n_trials)
+
+    return schedule
+
+
+def save_schedule(schedule, path):
+    np.save(path, schedule)
+
+
+def load_schedule(path):
+    return np.load(path)
+
+
+def get_blocks(schedule):
+    """
+    Returns a list of sets of block numbers (in order) + block types.
+    """
+    block_starts = np.flatnonzero(np.diff(schedule["block"], prepend=0))
+
+    return [
+        (int(schedule["block"][start]), BLOCK_TYPES[schedule["block_type"][start]])
+        for start in block_starts
+    ]
+
+
+def get_block(schedule, block_nr):
+    return schedule[schedule["block"] == block_nr]
@@ -6,10 +6,9 @@ To run the 'action coupled null-cue' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-from psychopy import visual
-from psychopy.hardware.keyboard import Keyboard
-from math import degrees, atan2, pi
+from math import pi
 import random
+from startup import StartupProfile
 
 # COLOURS = blue, pink, green, orange
 # COLOURS = [[19, 146, 206], [217, 103, 241], [101, 148, 14], [238, 104, 60]]
@@ -46,32 +45,103 @@ def get_monitor_and_dir(testing: bool):
     return monitor, directory
 
 
-def get_settings(monitor: dict, directory, colour_assignment):
-    window = visual.Window(
-        color=("#7F7F7F"),
-        size=monitor["resolution"],
-        units="pix",
-        fullscr=True,
+def get_settings(
+    monitor: dict,
+    directory,
+    colour_assignment,
+    observer=None,
+    offscreen=False,
+    profile=None,
+    colours=None,
+    timeline=None,
+):
+    """
+    Pass a headless.SimulatedObserver as `observer` to run without a screen
+    and keyboard. Use `offscreen` to draw to a hidden window that doesn't wait
+    for the screen refresh (for benchmarking). Pass a startup.StartupProfile as
+    `profile` to time every step. Pass the `colours` of an earlier run to
+    continue with the same colours (see checkpoint.py). Pass the path of a
+    `timeline` file to show the phases of every trial differently (see
+    timeline.py).
+    """
+    # Only imported here, so get_monitor_and_dir doesn't have to wait for psychopy
+    from psychopy import core, visual
+    from psychopy.hardware.keyboard import Keyboard
+    from stimuli import StimulusPool, prewarm_text_cache, create_psychopy_stimulus
+    from triggers import TriggerCodec
+    from response import make_dial_trajectory
+    from headless import (
+        SimulatedClock,
+        NullWindow,
+        SimulatedKeyBackend,
+        create_null_stimulus,
     )
+    from inputs import InputEngine, PsychopyKeyBackend
+    from timing import FlipLog
+    from timeline import TIMELINE_FILE, load_timelines
+    from geometry import Geometry
 
-    degrees_per_pixel = degrees(atan2(0.5 * monitor["width"], monitor["distance"])) / (
-        0.5 * monitor["resolution"][0]
-    )
+    if profile is None:
+        profile = StartupProfile()
+
+    if observer:
+        clock = SimulatedClock()
+        window = NullWindow(monitor, clock)
+        keyboard = InputEngine(SimulatedKeyBackend(observer, clock), clock)
+        mouse = None
+        create_stimulus = create_null_stimulus
+    else:
+        with profile.stage("window creation"):
+            window = visual.Window(
+                color=("#7F7F7F"),
+                size=monitor["resolution"],
+                units="pix",
+                fullscr=not offscreen,
+                visible=not offscreen,
+                waitBlanking=not offscreen,
+            )
+        with profile.stage("keyboard"):
+            # Key events on the same clock as the flips, see inputs.py
+            clock = core.monotonicClock
+            keyboard = InputEngine(
+                PsychopyKeyBackend(Keyboard(), clock.getLastResetTime()),
+                clock.getTime,
+            )
+        mouse = visual.CustomMouse(win=window, visible=False)
+        create_stimulus = create_psychopy_stimulus
 
-    colour_3 = {"orange": COLOURS[2], "blue": COLOURS[0], "green": COLOURS[1]}[
-        colour_assignment
-    ]
-    COLOURS.remove(colour_3)
-    [colour_1, colour_2] = random.sample(COLOURS, 2)
+    if colours is None:
+        colour_3 = {"orange": COLOURS[2], "blue": COLOURS[0], "green": COLOURS[1]}[
+            colour_assignment
+        ]
+        COLOURS.remove(colour_3)
+        [colour_1, colour_2] = random.sample(COLOURS, 2)
+        colours = [colour_1, colour_2, colour_3]
 
-    return dict(
-        deg2pix=lambda deg: round(deg / degrees_per_pixel),
+    settings = dict(
+        # every size and position in pixels, worked out once for this monitor
+        geometry=Geometry(monitor),
         # move the dial a quarter circle per second
         dial_step_size=(0.5 * pi) / monitor["Hz"],
         window=window,
-        keyboard=Keyboard(),
-        mouse=visual.CustomMouse(win=window, visible=False),
+        keyboard=keyboard,
+        mouse=mouse,
+        create_stimulus=create_stimulus,
         monitor=monitor,
         directory=directory,
-        colours=[colour_1, colour_2, colour_3],
+        colours=colours,
+        triggers=TriggerCodec(),
+        flip_log=FlipLog(monitor),
+        timelines=load_timelines(timeline or TIMELINE_FILE),
     )
+
+    # Create every stimulus that is drawn during a trial once, up front
+    with profile.stage("stimulus pool"):
+        settings["stimuli"] = StimulusPool(settings)
+        settings["dial_trajectory"] = make_dial_trajectory(settings)
+
+    # Lay out all texts that are shown during a trial before the experiment starts
+    with profile.stage("text cache"):
+        prewarm_text_cache(window, create_stimulus)
+
+    return settings
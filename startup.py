@@ -0,0 +1,82 @@
+"""
+This file contains the functions necessary for
+measuring how long the experiment takes to start.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+To see where the time before the first screen goes, run:
+
+   python main.py --profile-startup
+
+or, without screen and eyetracker:
+
+   python main.py --profile-startup --headless
+
+made by Anna van Harmelen, 2025
+"""
+
+from contextlib import contextmanager
+from time import perf_counter
+import sys
+
+
+class StartupProfile:
+    """
+    Times every step of starting the experiment, and how many modules each
+    step imported.
+
+    usage:
+
+       profile = StartupProfile()
+
+       with profile.stage("import psychopy"):
+           from psychopy import visual
+
+       with profile.stage("window creation"):
+           window = visual.Window()
+
+       profile.mark("age prompt")
+       profile.report()
+    """
+
+    def __init__(self) -> None:
+        self.start = perf_counter()
+        self.stages = []
+        self.marks = []
+
+    @contextmanager
+    def stage(self, name):
+        n_modules = len(sys.modules)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append(
+                (name, perf_counter() - start, len(sys.modules) - n_modules)
+            )
+
+    def mark(self, name):
+        """
+        Remember how long after the start something happened (e.g. the first screen).
+        """
+        self.marks.append((name, perf_counter() - self.start))
+
+    def report(self, file=sys.stdout):
+        total = perf_counter() - self.start
+
+        print(f"{'stage':<32}{'time (ms)':>12}{'share':>8}{'modules':>10}", file=file)
+        for name, duration, n_modules in self.stages:
+            print(
+                f"{name:<32}{duration * 1000:>12.1f}{duration / total:>8.0%}"
+                f"{n_modules:>10}",
+                file=file,
+            )
+
+        rest = total - sum(duration for _, duration, _ in self.stages)
+        print(
+            f"{'(everything else)':<32}{rest * 1000:>12.1f}{rest / total:>8.0%}",
+            file=file,
+        )
+        print(f"{'total':<32}{total * 1000:>12.1f}", file=file)
+
+        for name, time in self.marks:
+            print(f"{name} after {time * 1000:.1f} ms", file=file)
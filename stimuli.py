@@ -7,85 +7,241 @@ made by Anna van Harmelen, 2025
 """
 
 from psychopy import visual
+from collections import OrderedDict
 
-ECCENTRICITY = 6
-DOT_SIZE = 0.1  # radius of inner circle
-TOTAL_DOT_SIZE = 0.35  # radius of outer circle
-BAR_SIZE = [0.6, 4]  # width, height
-RESPONSE_DIAL_SIZE = 2  # radius of circle
+BAR_POSITIONS = ["left", "right", "middle"]
 
-decentral_dot = fixation_dot = None
+TEXT_FONT = "Courier New"
+TEXT_HEIGHT = 22
+TEXT_CACHE_SIZE = 256  # maximum number of different texts kept in memory
 
+# Number of stimulus objects created so far, see StimulusPool
+allocations = 0
 
-def create_fixation_dot(settings, block_type, colour="#eaeaea"):
-    global decentral_dot, fixation_dot
-
-    # Make fixation dot
-    if decentral_dot is None:
-        decentral_dot = visual.Circle(
-            win=settings["window"],
-            units="pix",
-            radius=settings["deg2pix"](TOTAL_DOT_SIZE),
-            pos=(0, 0),
-            fillColor=colour,
+
+def create_psychopy_stimulus(stimulus_type, **attributes):
+    # settings["create_stimulus"] during the experiment, see headless.py for the other
+    return stimulus_type(**attributes)
+
+
+class StimulusPool:
+    """
+    Holds every stimulus that is drawn during a trial, so that none of them have to be
+    rebuilt inside the timed part of a trial. Only ori/fillColor/lineColor/pos are
+    updated per trial.
+
+    usage:
+
+       settings["stimuli"] = StimulusPool(settings)
+
+    To check that a trial did not create any new stimuli:
+
+       settings["stimuli"].start_trial()
+       ...
+       settings["stimuli"].allocated_this_trial()  # should be 0
+    """
+
+    def __init__(self, settings) -> None:
+        self.decentral_dot = _track(
+            settings["create_stimulus"](
+                visual.Circle,
+                win=settings["window"],
+                units="pix",
+                radius=settings["geometry"].total_dot_radius,
+                pos=(0, 0),
+                fillColor="#eaeaea",
+            )
+        )
+        self.fixation_dot = _track(
+            settings["create_stimulus"](
+                visual.Circle,
+                win=settings["window"],
+                units="pix",
+                radius=settings["geometry"].dot_radius,
+                pos=(0, 0),
+                fillColor="#000000",
+            )
         )
-    decentral_dot.fillColor = colour
-
-    if fixation_dot is None:
-        fixation_dot = visual.Circle(
-            win=settings["window"],
-            units="pix",
-            radius=settings["deg2pix"](DOT_SIZE),
-            pos=(0, 0),
-            fillColor="#000000",
+
+        self.bars = {
+            position: _make_bar(position, settings) for position in BAR_POSITIONS
+        }
+
+        # The probe cue and the response dial are the same circle
+        geometry = settings["geometry"]
+        self.dial_circle = make_circle(geometry.dial_radius, settings)
+        self.handle_positions = geometry.handle_positions
+        self.top_handle = make_circle(
+            geometry.handle_radius,
+            settings,
+            pos=geometry.handle_positions[0],
+            handle=True,
         )
+        self.bottom_handle = make_circle(
+            geometry.handle_radius,
+            settings,
+            pos=geometry.handle_positions[1],
+            handle=True,
+        )
+
+        self._allocations_at_trial_start = allocations
+
+    def start_trial(self):
+        self._allocations_at_trial_start = allocations
 
-    decentral_dot.draw()
-    fixation_dot.draw()
+    def allocated_this_trial(self):
+        return allocations - self._allocations_at_trial_start
+
+
+def _track(stimulus):
+    global allocations
+    allocations += 1
+
+    return stimulus
+
+
+def create_fixation_dot(settings, block_type, colour="#eaeaea"):
+    stimuli: StimulusPool = settings["stimuli"]
+
+    # Draw fixation dot
+    stimuli.decentral_dot.fillColor = colour
+    stimuli.decentral_dot.draw()
+    stimuli.fixation_dot.draw()
 
     create_block_info_signal(block_type, settings)
 
 
+class TextCache:
+    """
+    Bounded least-recently-used cache of laid out text stimuli, keyed on
+    (text, colour, height, font). Laying out the glyphs of a TextStim is slow, so
+    every text that is shown during a trial should be pre-warmed before the
+    experiment starts, see prewarm_text_cache.
+
+    The hits and misses counters can be used to check that no text had to be laid
+    out during a trial:
+
+       text_cache.start_trial()
+       ...
+       text_cache.missed_this_trial()  # should be 0
+    """
+
+    def __init__(
+        self, max_size=TEXT_CACHE_SIZE, create_stimulus=create_psychopy_stimulus
+    ) -> None:
+        self.max_size = max_size
+        self.create_stimulus = create_stimulus
+        self.window = None
+        self.textstims = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._misses_at_trial_start = 0
+
+    def get(self, window, text, colour, height=TEXT_HEIGHT, font=TEXT_FONT):
+        # Stimuli can't be shared between windows
+        if window is not self.window:
+            self.textstims.clear()
+            self.window = window
+
+        key = (
+            text,
+            tuple(colour) if isinstance(colour, list) else colour,
+            height,
+            font,
+        )
+
+        if key in self.textstims:
+            self.hits += 1
+            self.textstims.move_to_end(key)
+            return self.textstims[key]
+
+        self.misses += 1
+        textstim = _track(
+            self.create_stimulus(
+                visual.TextStim,
+                win=window,
+                font=font,
+                text=text,
+                color=colour,
+                height=height,
+            )
+        )
+        self.textstims[key] = textstim
+
+        # Evict least recently used text
+        if len(self.textstims) > self.max_size:
+            self.textstims.popitem(last=False)
+
+        return textstim
+
+    def start_trial(self):
+        self._misses_at_trial_start = self.misses
+
+    def missed_this_trial(self):
+        return self.misses - self._misses_at_trial_start
+
+
+text_cache = TextCache()
+
+
+def prewarm_text_cache(window, create_stimulus=create_psychopy_stimulus):
+    text_cache.create_stimulus = create_stimulus
+
+    # Feedback scores
+    for performance in range(0, 101):
+        text_cache.get(window, f"{performance}", "#ffffff")
+
+    # Block info signals
+    for block_type in ["respond 3", "respond not 3", None]:
+        text_cache.get(window, get_block_info_signal(block_type), "#999999")
+
+
 def show_text(input, window, pos=(0, 0), colour="#ffffff"):
-    textstim = visual.TextStim(
-        win=window, font="Courier New", text=input, color=colour, pos=pos, height=22
-    )
+    textstim = text_cache.get(window, input, colour)
+    textstim.pos = pos
 
     textstim.draw()
 
 
 def make_one_bar(orientation, colour, position, settings):
     # Check input
-    if position == "left":
-        pos = (-settings["deg2pix"](ECCENTRICITY), 0)
-    elif position == "right":
-        pos = (settings["deg2pix"](ECCENTRICITY), 0)
-    elif position == "middle":
-        pos = (0, 0)
-    else:
+    if position not in BAR_POSITIONS:
+        raise Exception(f"Expected 'left' or 'right', but received {position!r}. :(")
+
+    # Re-use bar stimulus
+    bar_stimulus = settings["stimuli"].bars[position]
+    bar_stimulus.ori = orientation
+    bar_stimulus.fillColor = colour
+
+    return bar_stimulus
+
+
+def _make_bar(position, settings):
+    if position not in BAR_POSITIONS:
         raise Exception(f"Expected 'left' or 'right', but received {position!r}. :(")
 
     # Create bar stimulus
-    bar_stimulus = visual.Rect(
+    bar_stimulus = settings["create_stimulus"](
+        visual.Rect,
         win=settings["window"],
         units="pix",
-        width=settings["deg2pix"](BAR_SIZE[0]),
-        height=settings["deg2pix"](BAR_SIZE[1]),
-        pos=pos,
-        ori=orientation,
-        fillColor=colour,
+        width=settings["geometry"].bar_width,
+        height=settings["geometry"].bar_height,
+        pos=settings["geometry"].bar_positions[position],
     )
 
-    return bar_stimulus
+    return _track(bar_stimulus)
 
 
-def make_circle(rad, settings, pos=(0, 0), handle=False, colour=None):
-    circle = visual.Circle(
+def make_circle(radius, settings, pos=(0, 0), handle=False, colour=None):
+    # `radius` and `pos` in pixels, see geometry.py
+    circle = settings["create_stimulus"](
+        visual.Circle,
         win=settings["window"],
-        radius=settings["deg2pix"](rad),
-        edges=settings["deg2pix"](1),
-        lineWidth=settings["deg2pix"](0.1),
-        pos=(settings["deg2pix"](pos[0]), settings["deg2pix"](pos[1])),
+        radius=radius,
+        edges=settings["geometry"].circle_edges,
+        lineWidth=settings["geometry"].circle_line_width,
+        pos=pos,
     )
 
     if handle:
@@ -95,7 +251,7 @@ def make_circle(rad, settings, pos=(0, 0), handle=False, colour=None):
         circle.lineColor = colour if colour else "#d4d4d4"
         circle.fillColor = None
 
-    return circle
+    return _track(circle)
 
 
 def create_stimuli_frame(
@@ -112,10 +268,13 @@ def create_capture_cue_frame(colour, block_type, settings):
 
 def create_probe_cue_frame(colour, block_type, settings):
     create_fixation_dot(settings, block_type)
-    make_circle(RESPONSE_DIAL_SIZE, settings, colour=colour).draw()
 
+    dial_circle = settings["stimuli"].dial_circle
+    dial_circle.lineColor = colour if colour else "#d4d4d4"
+    dial_circle.draw()
 
-def create_block_info_signal(block_type, settings):
+
+def get_block_info_signal(block_type):
     if block_type == "respond 3":
         signal = "+"
     elif block_type == "respond not 3":
@@ -123,9 +282,13 @@ def create_block_info_signal(block_type, settings):
     else:
         signal = ""
 
+    return signal
+
+
+def create_block_info_signal(block_type, settings):
     show_text(
-        signal,
+        get_block_info_signal(block_type),
         settings["window"],
-        pos=(settings["deg2pix"](20), -settings["deg2pix"](11)),
+        pos=settings["geometry"].block_signal_position,
         colour="#999999",
     )
@@ -0,0 +1,341 @@
+"""
+This file contains the functions necessary for
+running the screens of a trial from a timeline in timeline.json.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+A timeline is a list of phases, each with a duration (in seconds, the name of a
+trial characteristic like "ITI", or "response" to wait for the dial response), a
+frame builder and, optionally, the triggers sent at its start and end.
+To use other timings, copy timeline.json and run `python main.py --timeline <path>`.
+
+To check the timelines and see how many frames, and how much drawing time
+(using a baseline saved by benchmark.py), every phase takes, run:
+
+   python timeline.py --timeline timeline.json --baseline benchmark_baseline.json
+
+made by Anna van Harmelen, 2025
+"""
+
+from argparse import ArgumentParser
+import json
+import os
+from stimuli import (
+    create_fixation_dot,
+    create_stimuli_frame,
+    create_capture_cue_frame,
+    create_probe_cue_frame,
+    show_text,
+)
+from timing import FLIP_LABELS, duration_to_frames, show_for_frames
+from triggers import FRAMES
+from datafile import TRIAL_COLUMNS
+
+TIMELINE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "timeline.json"
+)
+
+# Trial characteristics that can be used as the duration of a phase, in seconds
+TRIAL_DURATIONS = ["ITI"]
+
+# Timelines every file should have, with the columns their trials are saved in
+REQUIRED_TIMELINES = {"trial": TRIAL_COLUMNS, "practice_dial": None}
+
+# Frames that show the response, so they can only come after it
+RESPONSE_FRAMES = ["show_feedback", "show_practice_feedback"]
+
+
+def draw_fixation_dot(trial, settings):
+    create_fixation_dot(settings, trial["response_type"])
+
+
+def draw_stimuli_frame(trial, settings):
+    create_stimuli_frame(
+        trial["left_orientation"],
+        trial["right_orientation"],
+        trial["stimuli_colours"],
+        trial["response_type"],
+        settings,
+    )
+
+
+def draw_capture_cue_frame(trial, settings):
+    create_capture_cue_frame(trial["capture_colour"], trial["response_type"], settings)
+
+
+def draw_probe_cue_frame(trial, settings):
+    create_probe_cue_frame(trial["target_colour"], trial["response_type"], settings)
+
+
+def draw_feedback(trial, settings):
+    create_fixation_dot(settings, trial["response_type"])
+    show_text(
+        f"{trial['performance']}",
+        settings["window"],
+        settings["geometry"].feedback_position,
+    )
+
+
+def draw_practice_bar(trial, settings):
+    for item in trial["additional_objects"]:
+        item.draw()
+
+
+def draw_practice_feedback(trial, settings):
+    create_fixation_dot(settings, "practice")
+    show_text(
+        f"{trial['performance']}",
+        settings["window"],
+        settings["geometry"].practice_feedback_position,
+    )
+
+
+# Named like the builders in benchmark.py, so their cost can be looked up
+FRAME_BUILDERS = {
+    "create_fixation_dot": draw_fixation_dot,
+    "create_stimuli_frame": draw_stimuli_frame,
+    "create_capture_cue_frame": draw_capture_cue_frame,
+    "create_probe_cue_frame": draw_probe_cue_frame,
+    "show_feedback": draw_feedback,
+    "show_practice_bar": draw_practice_bar,
+    "show_practice_feedback": draw_practice_feedback,
+}
+
+
+def load_timelines(path=TIMELINE_FILE):
+    with open(path) as file:
+        timelines = json.load(file)
+
+    for name, columns in REQUIRED_TIMELINES.items():
+        if name not in timelines:
+            raise Exception(f"{path!r} has no {name!r} timeline.")
+
+    for name, timeline in timelines.items():
+        validate_timeline(name, timeline, REQUIRED_TIMELINES.get(name))
+
+    return timelines
+
+
+def get_timing_columns(timeline):
+    """
+    The frame timing columns timing.FlipLog.report fills in for a trial shown
+    with `timeline`, the dial flips right after the phase waiting for a response.
+    """
+    labels = []
+    for phase in timeline:
+        labels.append((phase["phase"], phase["duration"] != "response"))
+        if phase["duration"] == "response":
+            labels.append(("dial", False))
+
+    columns = []
+    for screen, (label, fixed) in enumerate(labels):
+        columns.append(f"{label}_dropped_frames")
+
+        # The last screen of the trial stays on until the next trial
+        if screen == len(labels) - 1:
+            continue
+
+        columns.append(f"{label}_duration_in_ms")
+        if fixed:
+            columns += [f"{label}_intended_frames", f"{label}_actual_frames"]
+
+    return columns
+
+
+def validate_timeline(name, timeline, columns=None):
+    """
+    The required timelines have to wait for exactly one response.
+    With `columns`, also check that the timing of every phase can be saved in
+    them, so a trial can't fail to be written halfway through a session.
+    """
+    n_responses = 0
+
+    for phase in timeline:
+        where = f"Phase {phase.get('phase')!r} of timeline {name!r}"
+        duration = phase.get("duration")
+
+        if phase.get("phase") not in FLIP_LABELS:
+            raise Exception(f"{where} should be one of {FLIP_LABELS}.")
+        if phase.get("frame") not in FRAME_BUILDERS:
+            raise Exception(f"{where} has an unknown frame {phase.get('frame')!r}.")
+        if phase["frame"] in RESPONSE_FRAMES and not n_responses:
+            raise Exception(
+                f"{where} can only show {phase['frame']!r} after a response."
+            )
+
+        for trigger in ["trigger", "end_trigger"]:
+            if phase.get(trigger) is not None and phase[trigger] not in FRAMES:
+                raise Exception(
+                    f"{where} has an unknown {trigger} {phase[trigger]!r}."
+                )
+
+        if duration == "response":
+            n_responses += 1
+        elif isinstance(duration, str):
+            if duration not in TRIAL_DURATIONS:
+                raise Exception(f"{where} has an unknown duration {duration!r}.")
+        elif not isinstance(duration, (int, float)) or duration <= 0:
+            raise Exception(f"{where} should last longer than 0 seconds.")
+
+        if phase.get("end_trigger") and duration != "response":
+            raise Exception(f"{where} can only have an end_trigger if it waits.")
+
+    if n_responses > 1:
+        raise Exception(f"Timeline {name!r} can only wait for one response.")
+    if name in REQUIRED_TIMELINES and n_responses != 1:
+        raise Exception(f"Timeline {name!r} has to wait for a response.")
+
+    if columns is not None:
+        missing = [
+            column for column in get_timing_columns(timeline) if column not in columns
+        ]
+        if missing:
+            raise Exception(
+                f"The timing of timeline {name!r} can't be saved, these columns "
+                f"aren't in the data file: {missing}."
+            )
+
+
+class TrialPlan:
+    """
+    A timeline compiled for one block: the frame builder, triggers and number of
+    frames of every phase are looked up once, so running a trial only draws,
+    flips and sends triggers.
+
+    usage:
+
+       plan = TrialPlan(settings["timelines"]["trial"], block_type, settings)
+       response, intended_frames = plan.run(trial, respond, eyetracker)
+    """
+
+    def __init__(self, timeline, block_type, settings) -> None:
+        self.block_type = block_type
+        self.settings = settings
+        self.phases = []
+        self.intended_frames = {}
+
+        for phase in timeline:
+            duration = phase["duration"]
+            n_frames = None
+            if not isinstance(duration, str):
+                n_frames = duration_to_frames(duration, settings["monitor"])
+                self.intended_frames[phase["phase"]] = n_frames
+
+            self.phases.append(
+                (
+                    phase["phase"],
+                    duration,
+                    n_frames,
+                    FRAME_BUILDERS[phase["frame"]],
+                    phase.get("trigger"),
+                    phase.get("end_trigger"),
+                )
+            )
+
+    def encode(self, frame, trial):
+        return self.settings["triggers"].encode(
+            self.block_type,
+            frame,
+            trial["capture_colour_id"],
+            trial["trial_condition"],
+            trial["target_bar"],
+        )
+
+    def run(self, trial, respond, eyetracker=None):
+        """
+        Show every phase of one trial, triggers are only sent to `eyetracker` if
+        there is one. A "response" phase is flipped once, after which
+        respond(trial, settings, eyetracker) waits for the response.
+        `trial` is updated with the block type and the response, so the phases
+        after it can show the response. The intended frames that are returned are
+        only valid until the next trial.
+        """
+        settings = self.settings
+        trial["response_type"] = self.block_type
+        response = {}
+        draw_args = (trial, settings)
+
+        for phase, duration, n_frames, draw, trigger, end_trigger in self.phases:
+            if duration == "response":
+                draw(trial, settings)
+                flip_time = settings["flip_log"].flip(settings["window"], phase)
+                if eyetracker and trigger:
+                    eyetracker.send_trigger(self.encode(trigger, trial), flip_time)
+
+                response = respond(trial, settings, eyetracker)
+                trial.update(response)
+
+                if eyetracker and end_trigger:
+                    eyetracker.send_trigger(self.encode(end_trigger, trial))
+                continue
+
+            if n_frames is None:
+                n_frames = duration_to_frames(trial[duration], settings["monitor"])
+                self.intended_frames[phase] = n_frames
+
+            # Send the trigger at the first flip of the phase
+            send_trigger, onset_args = None, ()
+            if eyetracker and trigger:
+                send_trigger = eyetracker.send_trigger
+                onset_args = (self.encode(trigger, trial),)
+
+            show_for_frames(
+                n_frames, draw, phase, settings, send_trigger, draw_args, onset_args
+            )
+
+        return response, self.intended_frames
+
+
+def get_timeline_cost(timeline, monitor, baseline=None):
+    """
+    Number of frames of every phase with a fixed duration and, if a baseline of
+    benchmark.py is given, the median time it takes to draw them all, in ms.
+    """
+    cost = []
+
+    for phase in timeline:
+        n_frames = None
+        if not isinstance(phase["duration"], str):
+            n_frames = duration_to_frames(phase["duration"], monitor)
+
+        build_ms = None
+        if baseline and phase["frame"] in baseline:
+            build_ms = baseline[phase["frame"]]["build_and_draw"]["median_ms"]
+
+        cost.append(
+            {
+                "phase": phase["phase"],
+                "frame": phase["frame"],
+                "n_frames": n_frames,
+                "build_ms": (
+                    build_ms * n_frames if build_ms and n_frames else build_ms
+                ),
+            }
+        )
+
+    return cost
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Check timelines and show their cost.")
+    parser.add_argument("--timeline", default=TIMELINE_FILE)
+    parser.add_argument("--hz", type=float, default=239)
+    parser.add_argument("--baseline", default=None)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    for name, timeline in load_timelines(args.timeline).items():
+        print(f"{name}:")
+        for phase in get_timeline_cost(timeline, {"Hz": args.hz}, baseline):
+            n_frames = phase["n_frames"] if phase["n_frames"] else "varies"
+            build = "unknown"
+            if phase["build_ms"] and phase["n_frames"]:
+                build = f"{phase['build_ms']:.2f} ms"
+            elif phase["build_ms"]:
+                build = f"{phase['build_ms']:.2f} ms per frame"
+            print(
+                f"  {phase['phase']:<12}{phase['frame']:<26}{n_frames:>8}  {build}"
+            )
@@ -0,0 +1,149 @@
+"""
+This file contains the functions necessary for
+showing screens for an exact number of frames and
+keeping track of when every screen was actually shown.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import numpy as np
+
+# Every flip in a trial is labelled with the screen it showed, in this order
+FLIP_LABELS = [
+    "iti",
+    "stimuli",
+    "delay",
+    "capture_cue",
+    "probe_delay",
+    "probe",
+    "dial",
+    "feedback",
+]
+LABEL_CODES = {label: code for code, label in enumerate(FLIP_LABELS)}
+
+# More than enough for the longest possible trial at 239 Hz
+MAX_FLIPS = 4096
+
+
+def duration_to_frames(duration, monitor):
+    """
+    Convert a duration in seconds to a whole number of screen refreshes,
+    every screen is shown for at least one refresh.
+    """
+    return max(1, round(duration * monitor["Hz"]))
+
+
+def show_for_frames(
+    n_frames,
+    something_to_draw,
+    label,
+    settings,
+    on_onset=None,
+    args=(),
+    onset_args=(),
+):
+    """
+    Show whatever `something_to_draw(*args)` draws for exactly `n_frames` refreshes.
+    The screen is redrawn before every flip, so it stays on screen until the next flip.
+    `on_onset` is called with `onset_args` and the timestamp of the first flip, right
+    after it. Passing arguments instead of a closure means nothing has to be
+    created per screen.
+    """
+    for frame in range(n_frames):
+        something_to_draw(*args)
+        flip_time = settings["flip_log"].flip(settings["window"], label)
+
+        if on_onset and frame == 0:
+            on_onset(*onset_args, flip_time)
+
+
+class FlipLog:
+    """
+    Keeps the timestamp of every flip in a trial in a preallocated buffer,
+    so the actual timing of every screen can be saved with the trial.
+
+    usage:
+
+       flip_log = FlipLog(monitor)
+       flip_log.reset()  # at the start of every trial
+       flip_time = flip_log.flip(window, "stimuli")  # instead of window.flip()
+       flip_log.report(intended_frames)
+       flip_log.onset("probe")  # when the probe was shown
+    """
+
+    def __init__(self, monitor, max_flips=MAX_FLIPS) -> None:
+        self.frame_duration = 1 / monitor["Hz"]
+        self.times = np.zeros(max_flips)
+        self.labels = np.zeros(max_flips, dtype=np.uint8)
+        self.n_flips = 0
+        self.last_flip_time = None
+
+    def reset(self):
+        self.n_flips = 0
+
+    def flip(self, window, label):
+        flip_time = window.flip()
+        self.last_flip_time = flip_time
+
+        if self.n_flips < len(self.times):
+            self.times[self.n_flips] = flip_time
+            self.labels[self.n_flips] = LABEL_CODES[label]
+        self.n_flips += 1
+
+        return flip_time
+
+    def onset(self, label):
+        """
+        Timestamp of the first flip of the screen with `label` in this trial.
+        """
+        n_flips = min(self.n_flips, len(self.times))
+        flips = np.flatnonzero(self.labels[:n_flips] == LABEL_CODES[label])
+
+        return self.times[flips[0]] if len(flips) else np.nan
+
+    def report(self, intended_frames):
+        """
+        Derive the actual duration and number of dropped frames of every screen
+        from the flip timestamps, and compare them to `intended_frames`.
+        """
+        n_flips = min(self.n_flips, len(self.times))
+        times = self.times[:n_flips]
+        labels = self.labels[:n_flips]
+
+        # Frames missed in between consecutive flips, except while the probe
+        # stays on screen waiting for a key press
+        intervals = np.diff(times)
+        missed = np.maximum(0, np.round(intervals / self.frame_duration) - 1)
+        missed[labels[:-1] == LABEL_CODES["probe"]] = 0
+
+        # Every screen starts where the label changes
+        onsets = np.flatnonzero(np.diff(labels.astype(int), prepend=-1))
+        ends = np.append(onsets[1:], n_flips - 1)
+
+        report = {"dropped_frames": int(missed.sum())}
+        onset_times = {}
+
+        for onset, end in zip(onsets, ends):
+            label = FLIP_LABELS[labels[onset]]
+            onset_times[label] = times[onset]
+            report[f"{label}_dropped_frames"] = int(missed[onset:end].sum())
+
+            # The last screen of the trial stays on until the next trial
+            if onset == onsets[-1]:
+                continue
+
+            duration = times[end] - times[onset]
+            report[f"{label}_duration_in_ms"] = round(duration * 1000, 2)
+
+            if label in intended_frames:
+                report[f"{label}_intended_frames"] = intended_frames[label]
+                report[f"{label}_actual_frames"] = round(duration / self.frame_duration)
+
+        for start, end in [("stimuli", "capture_cue"), ("capture_cue", "probe")]:
+            if start in onset_times and end in onset_times:
+                report[f"{start}_to_{end}_in_ms"] = round(
+                    (onset_times[end] - onset_times[start]) * 1000, 2
+                )
+
+        return report
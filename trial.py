@@ -7,22 +7,49 @@ To run the 'action coupled null-cue' experiment, see main.py.
 made by Anna van Harmelen, 2025
 """
 
-from psychopy import visual
-from psychopy.core import wait
-from time import time, sleep
 from response import get_response
-from stimuli import (
-    create_fixation_dot,
-    create_capture_cue_frame,
-    create_stimuli_frame,
-    create_probe_cue_frame,
-    show_text,
-)
-from eyetracker import get_trigger
+from stimuli import text_cache
+from timeline import TrialPlan
+from schedule import CONDITIONS, TARGET_BARS
 import random
 
 
 def generate_stimuli_characteristics(cue_colour, condition, target_bar, settings):
+    orientations = [
+        random.choice([-1, 1]) * random.randint(5, 85),
+        random.choice([-1, 1]) * random.randint(5, 85),
+    ]
+
+    return build_stimuli_characteristics(
+        cue_colour,
+        condition,
+        target_bar,
+        orientations,
+        random.randint(500, 800) / 1000,
+        random.random() < 0.5,
+        settings,
+    )
+
+
+def stimuli_characteristics_from_schedule(trial, settings):
+    """
+    Look up the characteristics of a trial in a schedule compiled by
+    schedule.compile_schedule.
+    """
+    return build_stimuli_characteristics(
+        int(trial["cue_colour"]),
+        CONDITIONS[trial["condition"]],
+        TARGET_BARS[trial["target_bar"]],
+        [int(trial["left_orientation"]), int(trial["right_orientation"])],
+        int(trial["ITI_in_ms"]) / 1000,
+        bool(trial["neutral_swap"]),
+        settings,
+    )
+
+
+def build_stimuli_characteristics(
+    cue_colour, condition, target_bar, orientations, ITI, neutral_swap, settings
+):
     if condition == "congruent":
         target_colour = settings["colours"][cue_colour - 1]
         distractor_colour = settings["colours"][(2 if cue_colour == 1 else 1) - 1]
@@ -30,12 +57,9 @@ def generate_stimuli_characteristics(cue_colour, condition, target_bar, settings
         distractor_colour = settings["colours"][cue_colour - 1]
         target_colour = settings["colours"][(2 if cue_colour == 1 else 1) - 1]
     elif condition == "neutral":
-        target_colour, distractor_colour = random.sample(settings["colours"][0:2], 2)
-
-    orientations = [
-        random.choice([-1, 1]) * random.randint(5, 85),
-        random.choice([-1, 1]) * random.randint(5, 85),
-    ]
+        target_colour, distractor_colour = settings["colours"][0:2]
+        if neutral_swap:
+            target_colour, distractor_colour = distractor_colour, target_colour
 
     if target_bar == "left":
         target_orientation = orientations[0]
@@ -45,7 +69,7 @@ def generate_stimuli_characteristics(cue_colour, condition, target_bar, settings
         stimuli_colours = [distractor_colour, target_colour]
 
     return {
-        "ITI": random.randint(500, 800) / 1000,
+        "ITI": ITI,
         "stimuli_colours": stimuli_colours,
         "capture_colour": settings["colours"][cue_colour - 1],
         "capture_colour_id": cue_colour,
@@ -69,15 +93,21 @@ def determine_response_required(block_type, cue_colour):
     return response_required
 
 
-def do_while_showing(waiting_time, something_to_do, window):
-    """
-    Show whatever is drawn to the screen for exactly `waiting_time` period,
-    while doing `something_to_do` in the mean time.
-    """
-    window.flip()
-    start = time()
-    something_to_do()
-    wait(waiting_time - (time() - start))
+def respond_to_probe(trial, settings, eyetracker):
+    # There is only an eyetracker to send triggers to when not testing
+    return get_response(
+        trial["target_orientation"],
+        trial["target_colour"],
+        trial["response_required"],
+        settings,
+        eyetracker is None,
+        eyetracker,
+        trial["trial_condition"],
+        trial["target_bar"],
+        trial["response_type"],
+        trial["capture_colour_id"],
+        trial.get("additional_objects", []),
+    )
 
 
 def single_trial(
@@ -91,127 +121,51 @@ def single_trial(
     capture_colour,
     capture_colour_id,
     trial_condition,
-    response_type,
+    plan: TrialPlan,
     response_required,
     settings,
     testing,
     eyetracker=None,
 ):
-    # Initial fixation cross to eliminate jitter caused by for loop
-    create_fixation_dot(settings, response_type)
-
-    screens = [
-        (0, lambda: 0 / 0, None),  # initial one to make life easier
-        (ITI, lambda: create_fixation_dot(settings, response_type), None),
-        (
-            0.25,
-            lambda: create_stimuli_frame(
-                left_orientation,
-                right_orientation,
-                stimuli_colours,
-                response_type,
-                settings,
-            ),
-            "stimuli_onset",
-        ),
-        (0.75, lambda: create_fixation_dot(settings, response_type), None),
-        (
-            0.25,
-            lambda: create_capture_cue_frame(capture_colour, response_type, settings),
-            "capture_cue_onset",
-        ),
-        (1.25, lambda: create_fixation_dot(settings, response_type), None),
-        (
-            None,
-            lambda: create_probe_cue_frame(target_colour, response_type, settings),
-            None,
-        ),
-    ]
-
-    # !!! The timing you pass to do_while_showing is the timing for the previously drawn screen. !!!
-
-    for index, (duration, _, frame) in enumerate(screens[:-1]):
-        # Send trigger if not testing
-        if not testing and frame:
-            trigger = get_trigger(
-                response_type,
-                frame,
-                capture_colour,
-                trial_condition,
-                target_bar,
-                settings,
-            )
-            eyetracker.tracker.send_message(f"trig{trigger}")
-
-        # Draw the next screen while showing the current one
-        do_while_showing(duration, screens[index + 1][1], settings["window"])
-
-    # The for loop only draws the probe cue, never shows it
-    # So show it here
-    if not testing:
-        trigger = get_trigger(
-            response_type,
-            "probe_cue_onset",
-            capture_colour,
-            trial_condition,
-            target_bar,
-            settings,
-        )
-        eyetracker.tracker.send_message(f"trig{trigger}")
-
-    settings["window"].flip()
-
-    response = get_response(
-        target_orientation,
-        target_colour,
-        response_required,
-        settings,
-        testing,
-        eyetracker,
-        trial_condition,
-        target_bar,
-        response_type,
-        capture_colour,
+    # Keep track of stimuli created during this trial (should be none)
+    settings["stimuli"].start_trial()
+    text_cache.start_trial()
+    settings["flip_log"].reset()
+    settings["keyboard"].take_log()  # only log the key events of this trial
+
+    # Only presses during this trial can be premature, or responses to the cue
+    settings["keyboard"].clear()
+
+    # Show every phase of the timeline, the probe stays on screen until a
+    # response is given
+    response, intended_frames = plan.run(
+        {
+            "ITI": ITI,
+            "left_orientation": left_orientation,
+            "right_orientation": right_orientation,
+            "target_bar": target_bar,
+            "target_colour": target_colour,
+            "target_orientation": target_orientation,
+            "stimuli_colours": stimuli_colours,
+            "capture_colour": capture_colour,
+            "capture_colour_id": capture_colour_id,
+            "trial_condition": trial_condition,
+            "response_required": response_required,
+        },
+        respond_to_probe,
+        None if testing else eyetracker,
     )
 
-    if not testing:
-        trigger = get_trigger(
-            response_type,
-            "response_offset",
-            capture_colour,
-            trial_condition,
-            target_bar,
-            settings,
-        )
-        eyetracker.tracker.send_message(f"trig{trigger}")
-
-    # Show performance
-    create_fixation_dot(settings, response_type)
-    show_text(
-        f"{response['performance']}", settings["window"], (0, settings["deg2pix"](0.7))
-    )
-
-    if not testing:
-        trigger = get_trigger(
-            response_type,
-            "feedback_onset",
-            capture_colour,
-            trial_condition,
-            target_bar,
-            settings,
-        )
-        eyetracker.tracker.send_message(f"trig{trigger}")
-    settings["window"].flip()
-    sleep(0.25)
-
     return {
-        "condition_code": get_trigger(
-            response_type,
+        "condition_code": settings["triggers"].encode(
+            plan.block_type,
             "stimuli_onset",
-            capture_colour,
+            capture_colour_id,
             trial_condition,
             target_bar,
-            settings,
         ),
+        "stimuli_allocated": settings["stimuli"].allocated_this_trial(),
+        "text_cache_misses": text_cache.missed_this_trial(),
+        **settings["flip_log"].report(intended_frames),
         **response,
     }
@@ -0,0 +1,144 @@
+"""
+This file contains the functions necessary for
+encoding trial events as eyetracker triggers and decoding them again.
+Every trigger is a frame number followed by a condition marker, e.g. 'trig112'.
+Doesn't depend on psychopy, so it can also be used for analysing the .edf files.
+To run the 'action coupled null-cue' experiment, see main.py.
+
+made by Anna van Harmelen, 2025
+"""
+
+import numpy as np
+
+FRAMES = [
+    "stimuli_onset",
+    "capture_cue_onset",
+    "cue_response_onset",
+    "probe_cue_onset",
+    "response_onset",
+    "response_offset",
+    "feedback_onset",
+]
+BLOCK_TYPES = ["respond 3", "respond not 3"]
+CONDITIONS = ["congruent", "incongruent", "neutral"]
+SIDES = ["left", "right"]
+
+# Conditions that can occur with every cue colour
+CUE_CONDITIONS = {
+    1: ["congruent", "incongruent"],
+    2: ["congruent", "incongruent"],
+    3: ["neutral"],
+}
+
+MAX_CONDITION_MARKER = 20
+
+
+def get_condition_marker(block_type, cue_id, condition, side):
+    condition_marker = {1: 1, 2: 5, 3: 9}[cue_id]
+
+    condition_marker = (
+        condition_marker + {"congruent": 0, "incongruent": 2, "neutral": 0}[condition]
+    )
+
+    if side == "right":
+        condition_marker += 1
+
+    if block_type == "respond not 3":
+        condition_marker += 10
+
+    return condition_marker
+
+
+class TriggerCodec:
+    """
+    Lookup tables for all triggers that can occur in the experiment, built and
+    checked once at startup.
+
+    usage:
+
+       codec = TriggerCodec()
+       codec.encode("respond 3", "stimuli_onset", 1, "congruent", "right")  # '12'
+       codec.decode("trig12")
+       codec.decode_many(messages)  # e.g. a column of EDF messages
+    """
+
+    def __init__(self) -> None:
+        self.codes = {}
+        self.factors = {}
+
+        for block_type in BLOCK_TYPES:
+            for cue_id, conditions in CUE_CONDITIONS.items():
+                for condition in conditions:
+                    for side in SIDES:
+                        marker = get_condition_marker(
+                            block_type, cue_id, condition, side
+                        )
+                        if marker > MAX_CONDITION_MARKER:
+                            raise Exception(
+                                f"Created condition marker ({marker}) doesn't exist. Received: {cue_id}, {condition}, {side}, {block_type}"
+                            )
+
+                        for frame_nr, frame in enumerate(FRAMES, start=1):
+                            code = f"{frame_nr}{marker}"
+                            factors = (block_type, frame, cue_id, condition, side)
+
+                            if code in self.factors:
+                                raise Exception(
+                                    f"Trigger {code} is used for both {self.factors[code]} and {factors}."
+                                )
+
+                            self.codes[factors] = code
+                            self.factors[code] = factors
+
+        # Lookup arrays for decoding many codes at once, indexed by the code as integer
+        self.lookup_size = max(int(code) for code in self.factors) + 1
+        self.lookup = {
+            name: np.full(self.lookup_size, -1, dtype=np.int8)
+            for name in ["block_type", "frame", "cue_id", "condition", "side"]
+        }
+        for code, (block_type, frame, cue_id, condition, side) in self.factors.items():
+            self.lookup["block_type"][int(code)] = BLOCK_TYPES.index(block_type)
+            self.lookup["frame"][int(code)] = FRAMES.index(frame)
+            self.lookup["cue_id"][int(code)] = cue_id
+            self.lookup["condition"][int(code)] = CONDITIONS.index(condition)
+            self.lookup["side"][int(code)] = SIDES.index(side)
+
+    def encode(self, block_type, frame, cue_id, condition, side):
+        return self.codes[(block_type, frame, cue_id, condition, side)]
+
+    def decode(self, code):
+        block_type, frame, cue_id, condition, side = self.factors[
+            code.removeprefix("trig")
+        ]
+
+        return {
+            "block_type": block_type,
+            "frame": frame,
+            "cue_id": cue_id,
+            "condition": condition,
+            "side": side,
+        }
+
+    def decode_many(self, codes):
+        """
+        Decode a whole array of codes (with or without 'trig' prefix) at once.
+        Returns an array per factor, holding indices into BLOCK_TYPES, FRAMES,
+        CONDITIONS and SIDES, or the cue id.
+        Codes that don't exist, and messages that aren't codes, are -1 in every
+        array.
+        """
+        codes = np.char.replace(np.asarray(codes, dtype=str), "trig", "")
+
+        # Other messages (and numbers too long to be a code) can't be converted
+        numeric = np.char.isdigit(codes) & (
+            np.char.str_len(codes) <= len(str(self.lookup_size))
+        )
+        codes = np.where(numeric, codes, "-1").astype(np.int64)
+
+        valid = (codes >= 0) & (codes < self.lookup_size)
+        codes = np.where(valid, codes, 0)
+
+        return {
+            name: np.where(valid, lookup[codes], -1)
+            for name, lookup in self.lookup.items()
+        }